@@ -0,0 +1,326 @@
+#!/usr/bin/python2
+
+import os
+import sys
+import time
+import json
+import getopt
+import shutil
+import platform
+import tempfile
+import resource
+import itertools
+import multiprocessing
+import numpy
+import builder
+from event_sorter import EVENT_DTYPE, EVENT_KEYS
+
+# Stages of the pipeline in the order run_case runs them
+STAGES = ['arrivals', 'static', 'pool', 'events', 'sort', 'join', 'write']
+
+CASE_KEYS = ['size', 'dimentions', 'distribution', 'events_per_line']
+
+DISTRIBUTION_OPTIONS = {
+    'E' : '--uniform',
+    'C' : '--correlated',
+    'A' : '--anticorrelated'
+}
+
+DEFAULT_SIZES = [10000, 100000]
+DEFAULT_DIMENTIONS = [3, 6]
+DEFAULT_DISTRIBUTIONS = ['E', 'C', 'A']
+DEFAULT_EVENTS_PER_LINE = [1, 5000]
+
+# Percentage a stage may be slower than in the baseline
+DEFAULT_TOLERANCE = 25
+# Stages faster than this (in the run and the baseline) are only noise
+MIN_COMPARED_SECONDS = 0.05
+
+help_text = '''Usage:
+benchmark [options] -o <resultsfile>
+
+Runs the stages of the builder pipeline (arrivals, static file, kossmann tmp
+file, events, sort, join and write) for every combination of the
+sizes, dimentions, distributions and events per line given, and writes the
+wall time, events per second and peak RSS of every stage to <resultsfile>
+as json. Every combination runs in its own process with the same seed.
+
+Options:
+ --sizes <list>            comma separated dataset sizes (-s).
+                           Default is 10000,100000.
+
+ --dimentions <list>       comma separated dimentions (-d). Default is 3,6.
+
+ --distributions <list>    comma separated kossmann distributions, E
+                           (uniform), C (correlated) or A (anticorrelated).
+                           Default is E,C,A.
+
+ --events_per_line <list>  comma separated events per line of the output.
+                           Default is 1,5000.
+
+ --baseline <file>         compare every stage with the results file of a
+                           previous run, exits with status 1 if any stage
+                           is slower than the tolerance allows.
+
+ --tolerance <percent>     how much slower than the baseline a stage may be.
+                           Default is 25.
+'''
+
+
+def get_options(argv):
+    long_options = [\
+                    'sizes=',\
+                    'dimentions=',\
+                    'distributions=',\
+                    'events_per_line=',\
+                    'baseline=',\
+                    'tolerance='
+                    ]
+
+    try:
+        options, args = getopt.getopt(argv, 'o:', long_options)
+        if not options:
+            print help_text
+            sys.exit(1)
+    except getopt.GetoptError:
+        print help_text
+        sys.exit(2)
+    return options
+
+
+def parse_list(arg, name, valid=None):
+    values = arg.split(',')
+    if valid is None:
+        for value in values:
+            builder.check_num_parameter(value, name, '--' + name)
+        return [int(value) for value in values]
+    for value in values:
+        if value not in valid:
+            raise Exception('Error: invalid {0} {1}'.format(name, value))
+    return values
+
+
+def benchmark_cases(options):
+    sizes = DEFAULT_SIZES
+    dimentions = DEFAULT_DIMENTIONS
+    distributions = DEFAULT_DISTRIBUTIONS
+    events_per_line = DEFAULT_EVENTS_PER_LINE
+
+    for opt, arg in options:
+        if opt == '--sizes':
+            sizes = parse_list(arg, 'sizes')
+        elif opt == '--dimentions':
+            dimentions = parse_list(arg, 'dimentions')
+        elif opt == '--distributions':
+            distributions = parse_list(arg, 'distributions',\
+                DISTRIBUTION_OPTIONS)
+        elif opt == '--events_per_line':
+            events_per_line = parse_list(arg, 'events_per_line')
+
+    return [dict(zip(CASE_KEYS, case)) for case in itertools.product(\
+            sizes, dimentions, distributions, events_per_line)]
+
+
+def case_options(case, output_file_name):
+    return ['-o', output_file_name, '-s', str(case['size']),\
+            '-d', str(case['dimentions']),\
+            DISTRIBUTION_OPTIONS[case['distribution']],\
+            '--events_per_line', str(case['events_per_line']),\
+            '--poissparameter', '3', '--time', '100', '--interval', '100',\
+            '--seed', '1']
+
+
+def stage_result(case, stage, start, events):
+    wall_time = time.time() - start
+    result = dict(case)
+    result['stage'] = stage
+    result['wall_time'] = wall_time
+    result['events'] = int(events)
+    if wall_time > 0:
+        result['events_per_second'] = events / wall_time
+    else:
+        result['events_per_second'] = 0.0
+    # Peak RSS of the process up to the end of the stage (KB in Linux)
+    result['peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def run_case(case, output_dir):
+    # Runs the stages of a case one after the other, as builder.main does
+    # with a single testcase, with the output files in output_dir
+    options = builder.get_options(case_options(case,\
+        os.path.join(output_dir, 'benchmark')))
+    builder.check_options(options)
+    builder.parse_input(options)
+    results = []
+
+    start = time.time()
+    arrival_arr = builder.generate_arrivals()
+    arrivals = arrival_arr[0]
+    results.append(stage_result(case, 'arrivals', start,\
+        builder.stream_counts(arrivals).sum()))
+
+    start = time.time()
+    builder.generate_static_dataset()
+    results.append(stage_result(case, 'static', start, builder.G_SIZE))
+
+    start = time.time()
+    builder.call_kossman(arrival_arr)
+    splitter = None
+    sorter = None
+    try:
+        results.append(stage_result(case, 'pool', start,\
+            builder.stream_counts(arrivals).sum()))
+        splitter = builder.pool_splitter()
+
+        start = time.time()
+        sorter = builder.new_event_sorter(EVENT_DTYPE, EVENT_KEYS,\
+            '{0}_intermediate_file'.format(builder.get_kossman_filename()),\
+            builder.G_SIZE)
+        for block in builder.dataset_blocks(arrivals, splitter, 0):
+            sorter.add(block)
+        results.append(stage_result(case, 'events', start, sorter.count))
+
+        start = time.time()
+        sorter.sort()
+        results.append(stage_result(case, 'sort', start, sorter.count))
+
+        start = time.time()
+        blocks = list(builder.single_tuple_events(sorter.sorted_blocks()))
+        events = sum(len(block) for block in blocks)
+        results.append(stage_result(case, 'join', start, events))
+
+        start = time.time()
+        builder.write_outputfiles(iter(blocks), None)
+        results.append(stage_result(case, 'write', start, events))
+    finally:
+        if sorter is not None:
+            sorter.cleanup()
+        if splitter is not None:
+            splitter.cleanup()
+        if os.path.isfile(builder.get_kossman_filename()):
+            os.remove(builder.get_kossman_filename())
+
+    return results
+
+
+def run_case_process(case, output_dir, results_queue):
+    results_queue.put(run_case(case, output_dir))
+
+
+def run_benchmarks(cases):
+    # Cases run in their own process so peak RSS is measured for each one
+    results = []
+    for case in cases:
+        print_case(case)
+        output_dir = tempfile.mkdtemp(prefix='benchmark_')
+        results_queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run_case_process,\
+            args=(case, output_dir, results_queue))
+        try:
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                raise Exception('Error: benchmark of {0} failed'.format(\
+                    case_name(case)))
+            case_results = results_queue.get()
+        finally:
+            shutil.rmtree(output_dir)
+
+        for result in case_results:
+            print_result(result)
+        results += case_results
+    return results
+
+
+def case_name(case):
+    return 's={size} d={dimentions} {distribution} '.format(**case) +\
+        'events_per_line={events_per_line}'.format(**case)
+
+
+def result_key(result):
+    return tuple(result[key] for key in CASE_KEYS + ['stage'])
+
+
+def compare_results(results, baseline, tolerance):
+    # Returns (result, baseline result) for every stage that is slower than
+    # the tolerance allows, stages missing from the baseline are skipped
+    baseline_results = dict((result_key(result), result)\
+                            for result in baseline)
+    regressions = []
+    for result in results:
+        base = baseline_results.get(result_key(result))
+        if base is None:
+            continue
+        if max(result['wall_time'], base['wall_time']) < MIN_COMPARED_SECONDS:
+            continue
+        if result['wall_time'] > base['wall_time'] * (1 + tolerance / 100.0):
+            regressions.append((result, base))
+    return regressions
+
+
+def print_case(case):
+    sys.stdout.write('\n{0}\n'.format(case_name(case)))
+    sys.stdout.flush()
+
+
+def print_result(result):
+    print '  {0:<10}{1:>10.3f}s{2:>14.0f} events/s{3:>12} KB'.format(\
+        result['stage'], result['wall_time'], result['events_per_second'],\
+        result['peak_rss'])
+
+
+def print_regressions(regressions, tolerance):
+    if not regressions:
+        print '\nNo stage is more than {0}% slower than the baseline.'.\
+            format(tolerance)
+        return
+    print '\nStages more than {0}% slower than the baseline:'.format(tolerance)
+    for result, base in regressions:
+        print '  {0} {1}: {2:.3f}s (baseline {3:.3f}s)'.format(\
+            case_name(result), result['stage'], result['wall_time'],\
+            base['wall_time'])
+
+
+def machine_info():
+    return {
+        'platform' : platform.platform(),
+        'python' : platform.python_version(),
+        'numpy' : numpy.__version__,
+        'cpus' : multiprocessing.cpu_count()
+    }
+
+
+def main(argv):
+    options = get_options(argv)
+    results_file_name = None
+    baseline_file_name = None
+    tolerance = DEFAULT_TOLERANCE
+
+    for opt, arg in options:
+        if opt == '-o':
+            results_file_name = arg
+        elif opt == '--baseline':
+            builder.check_file_existence(arg, 'baseline', path_included=True)
+            baseline_file_name = arg
+        elif opt == '--tolerance':
+            builder.check_num_parameter(arg, 'tolerance', opt)
+            tolerance = int(arg)
+    if results_file_name is None:
+        raise Exception('Error: no results file selected')
+
+    results = run_benchmarks(benchmark_cases(options))
+    with open(results_file_name, 'w') as results_file:
+        json.dump({'machine' : machine_info(), 'results' : results},\
+            results_file, indent=1)
+
+    if baseline_file_name is not None:
+        with open(baseline_file_name) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = compare_results(results, baseline, tolerance)
+        print_regressions(regressions, tolerance)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
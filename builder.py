@@ -10,20 +10,55 @@ import numpy
 import math
 import linecache
 import resource
-import copy
+import multiprocessing
+import tempfile
+import contextlib
+import collections
+import kosmann_generator
 from kosmann_splitter import KosmannSplitter
+from event_sorter import EventSorter, EVENT_DTYPE, EVENT_KEYS, OUTPUT_KEYS,\
+                         SORTED_BLOCK_SIZE, output_dtype, output_block,\
+                         sort_order, run_blocks, fixed_size_blocks,\
+                         merge_sorted_blocks
+from event_joiner import EventJoiner, UPDATE_EVENT, EXPIRATION_EVENT,\
+                         join_state_bytes
+from event_writer import TextEventWriter, BinaryEventWriter, COMPRESSORS
+from checkpoint import Checkpoint, data_checksum
+from telemetry import Telemetry
 from os.path import dirname, abspath
 
 TIME = time.time()
-GENERATOR = 'generador.cpp'
 MAX_KOSSMAN_DATA_LIST_SIZE = 1000
-MAX_INTERMEDIATE_FILE_SIZE_GB = 5
-EXPIRATION_EVENT = 0
-UPDATE_EVENT = 1
-
-# Dataset will be generated with CONS_DATASET
-# times the number of rows of the testcase
-CONS_DATASET = 3
+TUPLES_PER_BLOCK = 65536
+EVENTS_PER_WINDOW = 262144
+POOL_DTYPES = ['float64', 'float32']
+OUTPUT_FORMATS = ['text', 'binary']
+
+# Shares of the memory budget (--memorybudget) of each process: text pools
+# are parsed in chunks of TEXT_CHUNK_MEMORY_SHARE, the join state may take
+# JOIN_MEMORY_SHARE (tuple ids are sharded otherwise) and each output writer
+# buffers WRITE_MEMORY_SHARE, up to MAX_WRITE_BUFFER_BYTES. Sorting takes
+# whatever the join state leaves.
+TEXT_CHUNK_MEMORY_SHARE = 1 / 16.0
+JOIN_MEMORY_SHARE = 0.5
+WRITE_MEMORY_SHARE = 1 / 32.0
+MAX_WRITE_BUFFER_BYTES = 64 * 1024 * 1024
+
+# Independent random streams of the run seed, one for each stage
+ARRIVALS_STREAM = 0
+STATIC_STREAM = 1
+POOL_STREAM = 2
+SHUFFLE_STREAM = 3
+TIMESTAMPS_STREAM = 4
+CALENDAR_STREAM = 5
+
+# Manifest of the completed stages, only with --checkpoint
+CHECKPOINT = None
+# Measures of every stage, only with --telemetry
+TELEMETRY = None
+# Draws the random defaults from the run seed, without touching the state
+# of the random module of the program using the builder
+DEFAULTS_RANDOM = None
 
 help_text = '''Usage:
 builder [options] -o <outputfile> -s <size> -d <dimentions>
@@ -53,7 +88,10 @@ Options:
                         will be used to generate arrival events)
                         example: --poissarray 5%2%10 for 3 dimentions.
 
- --testcases <num>      generate different testcases according to the same file
+ --testcases <num>      generate different testcases according to the same file.
+                        Testcases are generated in parallel, each one in its
+                        own process, and are written to <outputfile>_<num>_dyn
+                        and <outputfile>_<num>_joined.
 
  --leavereport          leave a report file describing the parameters used to
                         create the testcase(s)
@@ -70,7 +108,9 @@ Options:
                         in (poisson_interval / poisson_paramater) * 1.5.
                         Default value is 1.5.
 
- --resume  <file>       resume execution from specified tmp file
+ --resume  <file>       resume execution from specified tmp file. A kossmann
+                        file with a row for every dimention of every tuple
+                        (at least as wide as the arrivals) can be used too.
 
  --events_per_line      in some cases it is better to have many events per line
    <num>                rather then just one. That way many events can be written
@@ -85,6 +125,63 @@ Options:
 
  --dontdelete           keep kossmann tmp file (default is delete the file)
 
+ --memorybudget <num>   memory in GB the run may use, shared by the processes
+                        it starts. It sizes the join state, the sort (which
+                        falls back to sorting on disk), the output buffers
+                        and the chunks text tmp files are parsed in (1/16 of
+                        the budget, split between the parsing processes).
+                        When the join state of every tuple does not fit,
+                        tuple ids are split in shards as with --workers
+                        (unless --sortfree or --testcases are used). Default
+                        is 4.
+
+ --sortfree             generate events directly in timestamp order, merging
+                        the arrivals of every tuple by time windows instead
+                        of sorting the whole dataset.
+
+ --workers <num>        split the tuple ids in <num> shards that are generated,
+                        sorted and joined in parallel processes and merged
+                        by timestamp at the end. The output is the same as
+                        with a single worker. Cannot be used with --sortfree
+                        or --testcases.
+
+ --outputformat         format of the dyn and joined output files, either text
+   <format>             (default) or binary. Binary files are .npy files of
+                        records with fields ts, type, id, values and (joined
+                        only) static, that can be loaded with
+                        numpy.load(file, mmap_mode='r').
+
+ --compression <codec>  compress the text dyn and joined files while they are
+                        written, with gzip, bz2 or xz (when the lzma module
+                        is available). Files get the .gz, .bz2 or .xz suffix
+                        and are made of independent blocks compressed in
+                        parallel, whose offsets are listed in <file>.index.
+
+ --seed <num>           seed of every random choice of the run, the same seed
+                        gives the same output for any number of workers. By
+                        default a random seed is used (it is shown in the
+                        report).
+
+ --checkpoint           record the stages of the run as they complete (static
+                        file, kossmann tmp file, sorted dataset, shards and
+                        testcases) in <outputfile>_manifest, with the
+                        checksums of their files. Running again with the same
+                        options skips the completed stages, even without
+                        --seed, and intermediate files are kept until the
+                        output is complete.
+
+ --telemetry            measure the wall time, CPU time, events in and out,
+                        bytes read and written and peak RSS of every stage
+                        and write them to <outputfile>_telemetry.json, even
+                        if the run fails.
+
+ --profile              like --telemetry, also profiling every stage with
+                        cProfile into <outputfile>_profile_<stage>.prof.
+
+ --pooldtype <type>     type used to store kossmann values in the binary tmp
+                        file, either float64 (default) or float32. float32
+                        halves the tmp file size.
+
  --autodataset          generate medium to small random parameters for the
                         entire dataset (to generate a quick and dirty dataset
                         for tests)
@@ -139,7 +236,17 @@ def get_options(argv):
                      'expiration=',\
                      'interval=',
                      'time=',\
-                     'events_per_line='
+                     'events_per_line=',\
+                     'pooldtype=',\
+                     'outputformat=',\
+                     'compression=',\
+                     'seed=',\
+                     'checkpoint',\
+                     'telemetry',\
+                     'profile',\
+                     'memorybudget=',\
+                     'sortfree',\
+                     'workers='
                      ]
 
     try:
@@ -201,6 +308,12 @@ def check_not_arrivals(options):
         raise Exception('Error: --arrivals cannot be selected along with '+\
                         '--poissparameter or --poissarray')
 
+def check_workers(options):
+    opt_list = [x for x,y in options]
+    if '--sortfree' in opt_list or '--testcases' in opt_list:
+        raise Exception('Error: --workers cannot be selected along with '+\
+                        '--sortfree or --testcases')
+
 def check_num_parameter(arg,name,option):
     if '-' in arg or '.' in arg:
         raise Exception('Error: '+ name +' parameter(s) must be a positive '+\
@@ -244,6 +357,37 @@ def check_expiration(arg,name,option):
                         +') must be greater than zero.')
 
 
+def check_pool_dtype(arg):
+    if arg not in POOL_DTYPES:
+        raise Exception('Error: --pooldtype must be one of: '+\
+                            ', '.join(POOL_DTYPES))
+
+
+def check_output_format(arg):
+    if arg not in OUTPUT_FORMATS:
+        raise Exception('Error: --outputformat must be one of: '+\
+                            ', '.join(OUTPUT_FORMATS))
+
+
+def check_compression(arg, options):
+    if arg not in COMPRESSORS:
+        raise Exception('Error: --compression must be one of: '+\
+                            ', '.join(sorted(COMPRESSORS)))
+    if ('--outputformat', 'binary') in options:
+        raise Exception('Error: --compression can only be used with text'+\
+                        ' output')
+
+
+def check_seed(arg):
+    try:
+        seed = int(arg)
+    except ValueError:
+        raise Exception('Error: seed parameter (--seed) is not a number.')
+    if seed < 0 or seed >= 2**32:
+        raise Exception('Error: seed parameter (--seed) must be between 0 '+\
+                        'and 2^32 - 1')
+
+
 def check_auto(options):
     opt_list = [x for x,y in options]
 
@@ -274,6 +418,36 @@ def check_auto(options):
         if '--dontdelete' in opt_list:
             counter = counter - 1
 
+        if '--pooldtype' in opt_list:
+            counter = counter - 1
+
+        if '--outputformat' in opt_list:
+            counter = counter - 1
+
+        if '--compression' in opt_list:
+            counter = counter - 1
+
+        if '--seed' in opt_list:
+            counter = counter - 1
+
+        if '--checkpoint' in opt_list:
+            counter = counter - 1
+
+        if '--telemetry' in opt_list:
+            counter = counter - 1
+
+        if '--profile' in opt_list:
+            counter = counter - 1
+
+        if '--memorybudget' in opt_list:
+            counter = counter - 1
+
+        if '--sortfree' in opt_list:
+            counter = counter - 1
+
+        if '--workers' in opt_list:
+            counter = counter - 1
+
         if '--leavesettings' in opt_list:
             counter = counter - 1
 
@@ -301,17 +475,18 @@ def check_interval(arg, options):
                raise Exception('Error: interval value must be smaller '+\
                 'than simulation time value')
 
-def check_options(options):
+def check_options(options, output=True):
     auto = False
     opt_list = [x for x,y in options]
-    if '-o' not in opt_list:
+    if output and '-o' not in opt_list:
         raise Exception('Error: no output file selected')
     for opt, arg in options:
         if opt == '-s':
             check_num_parameter(arg,'size',opt)
         elif opt == '-d':
             check_dimentions(arg)
-        elif opt == '-o':
+        elif opt == '-o' and output and '--checkpoint' not in opt_list:
+            # Outputs of an interrupted run are expected with --checkpoint
             check_outputfile(arg + '_dyn')
         elif opt == '--expiration':
             check_expiration(arg, 'expiration', opt)
@@ -336,6 +511,19 @@ def check_options(options):
             check_num_parameter(arg,'static dimentions',opt)
         elif opt == '--events_per_line':
             check_num_parameter(arg,'events per line',opt)
+        elif opt == '--pooldtype':
+            check_pool_dtype(arg)
+        elif opt == '--outputformat':
+            check_output_format(arg)
+        elif opt == '--compression':
+            check_compression(arg, options)
+        elif opt == '--seed':
+            check_seed(arg)
+        elif opt == '--memorybudget':
+            check_num_parameter(arg,'memory budget',opt)
+        elif opt == '--workers':
+            check_num_parameter(arg,'workers',opt)
+            check_workers(options)
         elif opt == '--arrrivals':
             check_arrivals(arg)
         elif opt == '--autodataset' or opt == '--autotiny':
@@ -344,6 +532,22 @@ def check_options(options):
 
     check_everything_set(auto,opt_list)
 
+def set_seed(options):
+    # Random defaults (and --autodataset values) also follow the seed
+    global G_SEED
+    global DEFAULTS_RANDOM
+    G_SEED = numpy.random.randint(0, 2**31 - 1)
+    for opt, arg in options:
+        if opt == '--seed':
+            G_SEED = int(arg)
+    DEFAULTS_RANDOM = random.Random(G_SEED)
+
+def random_state(stream, *keys):
+    # Every stage draws from its own stream of the run seed, further split
+    # by testcase, dimention or block of tuples so any part of the dataset
+    # can be generated on its own
+    return numpy.random.RandomState([G_SEED, stream] + list(keys))
+
 def set_defaults():
     global G_DATA_DIST_APPLICATION
     global G_DATA_DIST
@@ -366,25 +570,47 @@ def set_defaults():
     global G_STATICDATA
     global G_STATICDIMS
     global G_EXPIRATION
+    global G_POOL_DTYPE
+    global G_OUTPUT_FORMAT
+    global G_COMPRESSION
+    global G_MEMORY_BUDGET
+    global G_SORT_FREE
+    global G_WORKERS
+    global G_CHECKPOINT
+    global G_TELEMETRY
+    global G_PROFILE
+    global G_TMP_FILE
     global MAX_ACTUALIZATIONS_LIST_SIZE
 
 
     MAX_ACTUALIZATIONS_LIST_SIZE = 5000
 
+    G_SORT_FREE = False
+    G_WORKERS = 1
+    G_CHECKPOINT = False
+    G_TELEMETRY = False
+    G_PROFILE = False
+
+    G_POOL_DTYPE = 'float64'
+    G_OUTPUT_FORMAT = 'text'
+    G_COMPRESSION = None
+    G_MEMORY_BUDGET = 4
+
     G_STATICDATA = True
     G_STATICDIMS = None
     G_INDEPENDENT_DIMS = False
     G_LEAVE_SETTINGS  = None
     G_SETTINGS_FILE = None
     G_RESUME = None
+    G_TMP_FILE = get_path('tmp_{0}'.format(TIME))
     G_DELETE_TMP = True
     G_VERBOSE = False
     G_POISS_ARRAY = None
     G_LEAVE_REPORT = False
     G_DATA_DIST_APPLICATION = 'arrivals'
     G_DATA_DIST = 'E'
-    G_POISS_PARAMETER = random.randint(2,5)
-    G_SIMULATION_TIME = random.randint(100,600)
+    G_POISS_PARAMETER = DEFAULTS_RANDOM.randint(2,5)
+    G_SIMULATION_TIME = DEFAULTS_RANDOM.randint(100,600)
     G_INTERVAL = G_SIMULATION_TIME
     G_ARRIVALS = None
     G_TESTCASES = 1
@@ -464,10 +690,10 @@ def set_autodataset_values():
         min_arr = 2
         max_arr = 5
 
-    G_DIMENTIONS = random.randint(3,max_dim)
-    G_STATICDIMS = random.randint(3,max_dim)
-    G_SIZE = random.randint(min_size,max_size)
-    G_POISS_PARAMETER = (random.randint(min_arr,max_arr))
+    G_DIMENTIONS = DEFAULTS_RANDOM.randint(3,max_dim)
+    G_STATICDIMS = DEFAULTS_RANDOM.randint(3,max_dim)
+    G_SIZE = DEFAULTS_RANDOM.randint(min_size,max_size)
+    G_POISS_PARAMETER = (DEFAULTS_RANDOM.randint(min_arr,max_arr))
 
 def parse_auto(options):
     global G_AUTO
@@ -506,9 +732,23 @@ def parse_input(options):
     global G_STATICDATA
     global G_STATICDIMS
     global G_EXPIRATION
+    global G_POOL_DTYPE
+    global G_OUTPUT_FORMAT
+    global G_COMPRESSION
+    global G_MEMORY_BUDGET
+    global G_SORT_FREE
+    global G_WORKERS
+    global G_CHECKPOINT
+    global G_TELEMETRY
+    global G_PROFILE
     global MAX_ACTUALIZATIONS_LIST_SIZE
+    global CHECKPOINT
+    global TELEMETRY
 
+    set_seed(options)
     set_defaults()
+    CHECKPOINT = None
+    TELEMETRY = None
 
     for opt, arg in options:
         if opt == '-v':
@@ -516,7 +756,6 @@ def parse_input(options):
         elif opt == '-o':
             set_outputfile(arg)
         elif opt == '--testcases':
-            raise NotImplementedError('testcases option is not implemented.')
             G_TESTCASES = int(arg)
         elif opt == '--staticdata':
             G_STATICDATA = True
@@ -536,6 +775,25 @@ def parse_input(options):
             G_RESUME = arg
         elif opt == '--dontdelete':
             G_DELETE_TMP = False
+        elif opt == '--pooldtype':
+            G_POOL_DTYPE = arg
+        elif opt == '--outputformat':
+            G_OUTPUT_FORMAT = arg
+        elif opt == '--compression':
+            G_COMPRESSION = arg
+        elif opt == '--memorybudget':
+            G_MEMORY_BUDGET = int(arg)
+        elif opt == '--sortfree':
+            G_SORT_FREE = True
+        elif opt == '--workers':
+            G_WORKERS = int(arg)
+        elif opt == '--checkpoint':
+            G_CHECKPOINT = True
+        elif opt == '--telemetry':
+            G_TELEMETRY = True
+        elif opt == '--profile':
+            G_TELEMETRY = True
+            G_PROFILE = True
         elif opt == '--time':
             G_SIMULATION_TIME = float(arg)
         elif opt == '--independentdims':
@@ -547,6 +805,68 @@ def parse_input(options):
         parse_datadist_options(options)
         parse_probability_options(options)
 
+def start_checkpoint(options):
+    # A run without --seed is resumed with the seed of the interrupted one,
+    # so its random defaults are the same
+    global CHECKPOINT
+    checkpoint = Checkpoint(G_OUTPUTFILE + '_manifest',\
+        sorted([opt, arg] for opt, arg in options if opt != '-v'))
+    if checkpoint.seed is not None and checkpoint.seed != G_SEED:
+        parse_input(options + [('--seed', str(checkpoint.seed))])
+    checkpoint.seed = int(G_SEED)
+    CHECKPOINT = checkpoint
+
+def checkpoint_arrivals(arrival_arr):
+    # Arrivals are drawn again from the seed, if they are not the same the
+    # recorded stages belong to another run
+    checksum = data_checksum([arrivals for testcase_arrivals in arrival_arr\
+                              for arrivals in testcase_arrivals])
+    if not CHECKPOINT.done('arrivals', checksum):
+        CHECKPOINT.reset()
+        CHECKPOINT.complete('arrivals', checksum=checksum)
+
+def stage_done(stage):
+    return CHECKPOINT is not None and CHECKPOINT.done(stage)
+
+def complete_stage(stage, file_names=(), intermediate=False):
+    if CHECKPOINT is not None:
+        CHECKPOINT.complete(stage, file_names, intermediate=intermediate)
+
+def start_telemetry():
+    global TELEMETRY
+    TELEMETRY = Telemetry(G_PROFILE)
+
+def detach_telemetry():
+    # Processes forked for testcases and shards are measured as a whole by
+    # their parent
+    global TELEMETRY
+    if TELEMETRY is not None:
+        TELEMETRY.detach()
+    TELEMETRY = None
+
+@contextlib.contextmanager
+def measured(stage):
+    # Yields the counters of the stage, throwaway ones without telemetry
+    if TELEMETRY is None:
+        yield collections.defaultdict(int)
+    else:
+        with TELEMETRY.measure(stage) as counters:
+            yield counters
+
+def stage_blocks(stage, blocks, into=None):
+    if TELEMETRY is None:
+        return blocks
+    return TELEMETRY.blocks(stage, blocks, into)
+
+def write_telemetry(options, completed):
+    TELEMETRY.write_report(G_OUTPUTFILE + '_telemetry.json', {
+        'options' : [[opt, arg] for opt, arg in options],
+        'seed' : int(G_SEED),
+        'completed' : completed
+    })
+    if G_PROFILE:
+        TELEMETRY.dump_profiles(G_OUTPUTFILE + '_profile')
+
 def report_static_settings(of_settings):
     of_settings.write('\n# Static metadata (auto-generated by builder)\n')
 
@@ -587,7 +907,10 @@ def report_settings():
                    'SETTINGS_FILE', 'DATA_DIST_APPLICATION','DATA_DIST',
                    'LEAVE_SETTINGS','POISS_PARAMETER','TINY','DELETE_TMP',
                    'LEAVE_REPORT','AUTO','STATICDATA','STATICDIMS',\
-                   'INDEPENDENT_DIMS','INTERVAL','EXPIRATION']
+                   'INDEPENDENT_DIMS','INTERVAL','EXPIRATION','POOL_DTYPE',\
+                   'OUTPUT_FORMAT','COMPRESSION','SEED','CHECKPOINT',\
+                   'TELEMETRY','PROFILE',\
+                   'MEMORY_BUDGET','SORT_FREE','WORKERS']
 
         of_settings.write('# Dynamic metadata (auto-generated by builder)\n')
         for variable in globals():
@@ -640,13 +963,41 @@ def get_kossman_filename():
     if G_RESUME is not None:
         return get_path('{0}'.format(G_RESUME))
     else:
-        return get_path('tmp_{0}'.format(TIME))
+        return G_TMP_FILE
 
-def randomize_file():
-    print_verbose_message('Randomizing kossman file...')
-    file_name = get_kossman_filename()
-    os.system('sort -R {0} -o {1}'.format(file_name, file_name))
-    print_verbose_message(' done.\n')
+def get_output_filename(name, testcase_num=None):
+    if testcase_num is None:
+        return '{0}_{1}'.format(G_OUTPUTFILE, name)
+    else:
+        return '{0}_{1}_{2}'.format(G_OUTPUTFILE, testcase_num, name)
+
+def stream_counts(arrivals):
+    # Arrivals of every (dim, tuple) stream, in the order of the pool
+    return numpy.concatenate(arrivals).astype(numpy.int64)
+
+def pool_starts(arrival_arr):
+    # The values of every testcase follow those of the previous one
+    totals = [int(stream_counts(arrivals).sum()) for arrivals in arrival_arr]
+    return numpy.cumsum([0] + totals[:-1]).tolist()
+
+def pool_splitter(testcase=0, pool_start=0, processes=1):
+    # Flat pools start the values of the testcase at pool_start, the rows of
+    # pools of other tools are read in a seeded order of the testcase. Text
+    # pools are parsed by the processes given, each in chunks of its share
+    # of the budget.
+    splitter = KosmannSplitter(get_kossman_filename(),\
+        text_chunk_gb() / processes, G_VERBOSE, processes=processes)
+    if splitter.flat:
+        splitter.set_first_row(pool_start)
+    else:
+        splitter.shuffle(random_state(SHUFFLE_STREAM, testcase))
+    return splitter
+
+def stream_row(splitter, starts, stream):
+    # Row of the pool where the values of the stream start
+    if splitter.flat:
+        return starts[stream]
+    return stream
 
 
 def dynamic_data_dist_warning():
@@ -658,67 +1009,67 @@ def dynamic_data_dist_warning():
         if ans == 'n':
             sys.exit()
 
-def call_kossman():
+def call_kossman(arrival_arr, interactive=True):
+    global G_RESUME
     if G_RESUME is not None:
         return
 
-    if not os.path.isfile(get_path(GENERATOR)):
-        raise Exception('Error: kossman generator does exist')
-
-    if not os.path.isfile(get_path('generador')):
-        os.system('g++ {0} -o {1}'.format(get_path(GENERATOR),get_path('generator')))
+    if stage_done('pool'):
+        G_RESUME = os.path.basename(CHECKPOINT.files('pool')[0])
+        print_verbose_message('Using kossmann tmp file of the last run.\n')
+        return
 
     if G_DATA_DIST_APPLICATION == 'arrivals':
-        size = G_SIZE * G_DIMENTIONS * CONS_DATASET
-        dimentions = G_ARRIVALS
-        if dimentions <= 1:
-            dimentions = 2
+        # Exactly the values the arrivals need: the updates of every stream
+        # are the first values of a kossmann row as wide as the most
+        # arrivals, and every testcase has its own values
+        dimentions = max(G_ARRIVALS, 2)
+        sections = [stream_counts(arrivals) for arrivals in arrival_arr]
+        size = sum(int(counts.sum()) for counts in sections)
 
         if G_DATA_DIST != 'E' and dimentions >= 75:
-            dynamic_data_dist_warning()
+            if interactive:
+                dynamic_data_dist_warning()
             distribution = 'E'
         else:
             distribution = G_DATA_DIST
         print_verbose_message('Creating tmp file with Kossmann generator '+\
             'for dynamic dataset...')
-        os.system('{0} {1} {2} {3} {4} > /dev/null'.format(\
-            get_path('generator'), dimentions, distribution,size,
-            get_path('tmp_{0}_notail'.format(TIME))))
-        os.system('tail -n +2 {0} > {1}'.format(\
-            get_path('tmp_{0}_notail'.format(TIME)),\
-            get_kossman_filename()))
-        os.system('rm {0}'.format(get_path('tmp_{0}_notail'.format(TIME))))
+        with measured('pool') as stage:
+            kosmann_generator.write_stream_pool(get_kossman_filename(),\
+                sections, dimentions, distribution, G_POOL_DTYPE,\
+                [random_state(POOL_STREAM, testcase)\
+                 for testcase in range(0, len(sections))])
+            stage['events_out'] += size
+        complete_stage('pool', [get_kossman_filename()])
         print_verbose_message(' done.\n')
 
     else:
         raise NotImplementedError
 
-def create_poisson_arrival():
+def create_poisson_arrival(testcase):
     arrivals = []
     max_arr = []
 
-    if G_POISS_PARAMETER is not None:
+    for i in range(0,G_DIMENTIONS):
+        if G_POISS_PARAMETER is not None:
             # Single poisson parameter for all dimentions
-        for i in range(0,G_DIMENTIONS):
-            numpy_arr = numpy.random.poisson(\
-                (G_POISS_PARAMETER * G_SIMULATION_TIME) / float(G_INTERVAL)\
-                ,G_SIZE)
-            dim_poiss_events = numpy_arr.tolist()
-            arrivals.append(dim_poiss_events)
-            max_arr.append(max(dim_poiss_events))
-
-    else:
+            poiss_parameter = G_POISS_PARAMETER
+        else:
             # A different poisson parameter for each dimetion
-        for i in range(0,G_DIMENTIONS):
-            numpy_arr = numpy.random.poisson(\
-                (G_POISS_ARRAY[i] * G_SIMULATION_TIME) / float(G_INTERVAL)\
-                ,G_SIZE)
-            dim_poiss_events = numpy_arr.tolist()
-            arrivals.append(dim_poiss_events)
-            max_arr.append(max(dim_poiss_events))
+            poiss_parameter = G_POISS_ARRAY[i]
 
+        dim_poiss_events = numpy.concatenate([\
+            random_state(ARRIVALS_STREAM, testcase, i,\
+                first_id / TUPLES_PER_BLOCK).poisson(\
+                (poiss_parameter * G_SIMULATION_TIME) / float(G_INTERVAL),\
+                min(TUPLES_PER_BLOCK, G_SIZE - first_id))\
+            for first_id in range(0, G_SIZE, TUPLES_PER_BLOCK)])
+        arrivals.append(dim_poiss_events)
+        max_arr.append(dim_poiss_events.max())
 
-    overall_max = max(max_arr)
+
+    overall_max = int(max(max_arr))
     return (overall_max,arrivals)
 
 
@@ -728,7 +1079,7 @@ def generate_poisson_arrivals():
     max_arr = []
     global G_ARRIVALS
     for i in range(0,G_TESTCASES):
-        tpl = create_poisson_arrival()
+        tpl = create_poisson_arrival(i)
         max_arr.append(tpl[0])
         arrivals.append(tpl[1])
 
@@ -741,11 +1092,7 @@ def create_fixed_arrival():
     arrivals = []
 
     for i in range(0,G_DIMENTIONS):
-        dim_list = []
-        for j in range(0,G_SIZE):
-            dim_list.append(G_ARRIVALS)
-
-        arrivals.append(dim_list)
+        arrivals.append(numpy.repeat(G_ARRIVALS, G_SIZE))
 
     return arrivals
 
@@ -758,61 +1105,45 @@ def generate_fixed_arrivals():
     return arrivals
 
 
-def generate_timestamps(size,dim):
-
+def timestamps_scale(dim):
     if G_POISS_PARAMETER != None:
-        numpy_arr = numpy.random.exponential(\
-                    int(G_SIMULATION_TIME / \
-                        (( float(G_POISS_PARAMETER) * G_SIMULATION_TIME) / G_INTERVAL)) \
-                        ,size)
+        return int(G_SIMULATION_TIME / \
+            (( float(G_POISS_PARAMETER) * G_SIMULATION_TIME) / G_INTERVAL))
 
     elif G_POISS_ARRAY != None:
-        numpy_arr = numpy.random.exponential(\
-                    int(G_SIMULATION_TIME / \
-                        (( float(G_POISS_ARRAY[dim]) * G_SIMULATION_TIME) / G_INTERVAL)) \
-                        ,size)
+        return int(G_SIMULATION_TIME / \
+            (( float(G_POISS_ARRAY[dim]) * G_SIMULATION_TIME) / G_INTERVAL))
 
     else:
-        numpy_arr = numpy.random.exponential(\
-                    int(G_SIMULATION_TIME / float(G_ARRIVALS)), size)
-
+        return int(G_SIMULATION_TIME / float(G_ARRIVALS))
 
-    timestamp_intervals = numpy_arr.tolist()
 
-    time_counter = 0.0
-    timestamps = []
+def generate_timestamps(counts, dim, random_state=numpy.random):
+    # Gaps for every tuple of the block are drawn at once, each segment of
+    # 'counts' is then turned into timestamps starting again from zero
+    gaps = random_state.exponential(timestamps_scale(dim), counts.sum())
+    timestamps = numpy.cumsum(gaps)
+    segment_ends = numpy.cumsum(counts)
+    offsets = numpy.concatenate(([0.0], timestamps))[segment_ends - counts]
 
-    for interval in timestamp_intervals:
-        time_counter = time_counter + interval
-        timestamps.append(time_counter)
+    return timestamps - numpy.repeat(offsets, counts)
 
-    return timestamps
+def memory_budget_bytes():
+    return int(G_MEMORY_BUDGET * (1024**3))
 
-def sort_file(intermediate_file_name):
-    sorted_intermediate_file_name = intermediate_file_name +'_sorted'
+def text_chunk_gb():
+    return memory_budget_bytes() * TEXT_CHUNK_MEMORY_SHARE / float(1024**3)
 
+def write_buffer_bytes():
+    return int(min(memory_budget_bytes() * WRITE_MEMORY_SHARE,\
+                   MAX_WRITE_BUFFER_BYTES))
 
+def new_event_sorter(dtype, keys, tmp_file_name, join_size):
+    # The sorted events are read while the join state of join_size tuples
+    # is held, sorting gets the rest of the budget
+    return EventSorter(dtype, keys, max(0, memory_budget_bytes() -\
+        join_state_bytes(join_size, G_DIMENTIONS)), tmp_file_name)
 
-    os.system('sort -T . -g {0} -o {1}'.format(intermediate_file_name, \
-        sorted_intermediate_file_name))
-
-    check_file_existence(sorted_intermediate_file_name,'sorted tmp file',path_included=True)
-
-    return sorted_intermediate_file_name
-
-
-def init_single_data(single_data):
-    for id in range(0,G_SIZE):
-        single_data[id] = {
-            'current_event' : {'ts' : None, 'values' : dims_init()},
-            'current_expiration' : None
-        }
-
-def dims_init():
-    dims = {}
-    for i in range(0,G_DIMENTIONS):
-        dims[i] = None
-    return dims
 
 def tuples_ttl():
     if G_POISS_PARAMETER == None:
@@ -820,281 +1151,561 @@ def tuples_ttl():
     else:
         return (G_INTERVAL / G_POISS_PARAMETER) * G_EXPIRATION
 
-def update_expirations(ttl, ts_t, id_t, join_data, merged_file):
-    old_exp = join_data[id_t]['current_expiration']
-    if old_exp != None and (ts_t - old_exp) >= ttl:
-        if old_exp < G_SIMULATION_TIME:
-            exp_event = (old_exp, EXPIRATION_EVENT, id_t)
-            merged_file.write(str(exp_event)[1:] + '\n')
-
-    join_data[id_t]['current_expiration'] = ts_t + ttl
-
-def write_final_expirations(ttl, join_data, o_file):
-    for id_t in range(0, G_SIZE):
-        exp = join_data[id_t]['current_expiration']
-        if exp != None and exp <= G_SIMULATION_TIME:
-            exp_event = (exp, EXPIRATION_EVENT, id_t)
-            o_file.write(str(exp_event)[1:] + '\n')
-
-def create_static_dict():
-    static_file = open(G_OUTPUTFILE + '_static')
-    static_file.readline() #ignore first line
-    id_t = 0
-    static_dict = {}
-    for line in static_file:
-        tmp = line.split()
-        static_dict[id_t] = {}
-        for dim_t in range(0, G_DIMENTIONS):
-            static_dict[id_t][dim_t] = float(tmp[dim_t])
-        id_t += 1
-
-    return static_dict
-
-def insert_static_dims_to_update_event(ready_tuple, static_dict):
-    id_t = ready_tuple[2]
-    joined_ready_tuple = copy.copy(ready_tuple)
-    for dim_t in range(0, G_DIMENTIONS):
-        joined_ready_tuple[G_DIMENTIONS + 3 + dim_t] = static_dict[id_t][dim_t]
-    return joined_ready_tuple
-
-
-def single_tuple_events(unmerged_file_name, act_count):
-    if G_STATICDATA:
-        joined_file_name = G_OUTPUTFILE + '_joined'
-        joined_file = open(joined_file_name, 'wb')
-    print_verbose_message('Joining tuples into single events...\n')
-    merged_file_name = get_kossman_filename() + '_merged'
-    merged_file = open(merged_file_name,'w')
-    unmerged_file = open(unmerged_file_name)
-    perc_acum = 0
-    perc_total = act_count
-    perc = 0
-    single_data = {}
-    init_single_data(single_data)
-    ttl = tuples_ttl()
-    if G_STATICDATA:
-        static_dict = create_static_dict()
-
-    for tupl_str in unmerged_file:
-        perc = (perc_acum * 100) / perc_total
-        print_verbose_message('\r{0}%'.format(perc))
-
-        tupl = eval('(' + tupl_str)
-        ts_t, id_t, dim_t, val_t = tupl
-
-        single_data[id_t]['current_event']['values'][dim_t] = val_t
-        ready_tuple = {}
-        arrivals_are_complete = True
-        for i in range(0,G_DIMENTIONS):
-            if single_data[id_t]['current_event']['values'][i] == None:
-                arrivals_are_complete = False
-                break
-            else:
-                ready_tuple[i+3] = single_data[id_t]['current_event']['values'][i]
-
-        perc_acum += 1
+def create_static_table():
+    # Static values indexed by tuple id, only the first G_DIMENTIONS columns
+    # are joined
+    static_table = kosmann_generator.read_data(G_OUTPUTFILE + '_static')
+    return numpy.ascontiguousarray(static_table[:, :G_DIMENTIONS])
 
-        if not arrivals_are_complete:
-            continue
+def insert_static_dims_to_update_events(block, static_table):
+    updates = block['type'] == UPDATE_EVENT
+    static_values = numpy.empty((len(block), G_DIMENTIONS))
+    static_values.fill(numpy.nan)
+    static_values[updates] = static_table[block['id'][updates]]
+    return output_block(output_dtype(2 * G_DIMENTIONS), block['ts'],\
+        block['type'], block['id'],\
+        numpy.hstack((block['values'], static_values)))
 
-        update_expirations(ttl, ts_t, id_t, single_data, merged_file)
 
-        ready_tuple[0] = ts_t
-        ready_tuple[1] = UPDATE_EVENT
-        ready_tuple[2] = id_t
-        if G_STATICDATA:
-            joined_ready_tuple = insert_static_dims_to_update_event(\
-                ready_tuple, static_dict)
-            joined_tuple_event = tuple(joined_ready_tuple.values())
-            joined_file.write(str(joined_tuple_event)[1:] + '\n')
-
-        tuple_event = tuple(ready_tuple.values())
-        merged_file.write(str(tuple_event)[1:] + '\n')
+def single_tuple_events(events):
+    print_verbose_message('Joining tuples into single events...\n')
+    joiner = EventJoiner(G_SIZE, G_DIMENTIONS, tuples_ttl(), G_SIMULATION_TIME)
 
-        single_data[id_t]['current_event'] = {'ts' : None, 'values' : dims_init()}
+    for block in stage_blocks('join', joiner.ordered_events(events)):
+        with measured('join') as stage:
+            stage['expiration_events'] += int(\
+                (block['type'] == EXPIRATION_EVENT).sum())
+        if len(block):
+            perc = int((block['ts'][0] * 100) / G_SIMULATION_TIME)
+            print_verbose_message('\r{0}%'.format(perc))
+        yield block
 
-    unmerged_file.close()
-    write_final_expirations(ttl, single_data, merged_file)
-    merged_file.close()
-    if G_STATICDATA:
-        write_final_expirations(ttl, single_data, joined_file)
-        joined_file.close()
     print_verbose_message('\r done\n')
-    os.system('rm {0}'.format(unmerged_file_name))
-    print_verbose_message('Sorting dataset again for expiration events...\n')
-    sorted_merged_file_name = sort_file(merged_file_name)
-    if G_STATICDATA:
-        sorted_joined_file_name = sort_file(joined_file_name)
-        os.system('rm {0}'.format(joined_file_name))
-    print_verbose_message('\r done\n')
-    os.system('rm {0}'.format(merged_file_name))
-    if G_STATICDATA:
-        return (sorted_merged_file_name, sorted_joined_file_name)
-    else:
-        return sorted_merged_file_name
-
-def prepare_outputfile(intermediate_file_name, testcase_num, act_count):
-    print_verbose_message('Sorting dataset...')
-    sorted_intermediate_file_name = sort_file(intermediate_file_name)
-    print_verbose_message(' done.\n')
 
+def prepare_outputfile(events, testcase_num):
     if not G_INDEPENDENT_DIMS:
         if G_STATICDATA:
-            result =\
-            single_tuple_events(sorted_intermediate_file_name,act_count)
-            sorted_intermediate_file_name  = result[0]
-            sorted_joined_file_name = result[1]
-            write_outputfile(sorted_joined_file_name, testcase_num, act_count, 'joined')
-            write_outputfile(sorted_intermediate_file_name, testcase_num, act_count, 'dyn')
+            write_outputfiles(single_tuple_events(events), testcase_num)
         else:
             raise NotImplementedError('Generating only dynamic data'+\
                 ' is currently under development')
             sorted_intermediate_file_name = \
-            join_tuple_events(sorted_intermediate_file_name,act_count)
+            join_tuple_events(sorted_intermediate_file_name)
             write_outputfile(sorted_intermediate_file_name)
     else:
         raise NotImplementedError('independentdims option is not yet implemented.')
 
-def write_outputfile(o_file, testcase_num, act_count, name):
-
-    file_name = G_OUTPUTFILE + '_' + name
-
-    input_f = open(o_file)
-    output_f = open(file_name,'w')
-
-    print_verbose_message('Writing output file {0}...\n'.format(name))
-    line_counter = 0
-    acum = 0
-    of_line = ''
-    end_of_file_reached = False
-
-    while not end_of_file_reached:
-        while line_counter < MAX_ACTUALIZATIONS_LIST_SIZE:
-            try:
-                line = input_f.next()
-            except StopIteration:
-                end_of_file_reached = True
-                break
-            of_line += '(' + line.rstrip('\n') + ', '
-            line_counter += 1
-            acum += 1
-        p = (acum * 100) / act_count
-        print_verbose_message('\r{0}%'.format(p))
-        if end_of_file_reached:
-            output_f.write(of_line[:-2] + '\n')
-        else:
-            output_f.write(of_line[:-2] + '\n')
-        line_counter = 0
-        of_line = ''
-
-    output_f.close()
-    os.system('rm {0}'.format(o_file))
-    print_verbose_message('\r done.\n')
-
-def intermediate_file_writer(result,intermediate_file):
-    while result:
-        tp = result.pop()
-
-        #To improve lines could be longer
-        intermediate_file.write(str(tp)[1:] + "\n")
-        yield
-
+def event_file_name(name, testcase_num):
+    file_name = get_output_filename(name, testcase_num)
+    if G_COMPRESSION is not None:
+        return file_name + COMPRESSORS[G_COMPRESSION][1]
+    return file_name
+
+def event_file_names(testcase_num):
+    file_names = [event_file_name(name, testcase_num)\
+                  for name in ['dyn', 'joined']]
+    if G_COMPRESSION is not None:
+        file_names += [file_name + '.index' for file_name in file_names]
+    return file_names
+
+def new_event_writer(name, testcase_num, static_dimentions, pool, processes):
+    file_name = event_file_name(name, testcase_num)
+    if G_OUTPUT_FORMAT == 'binary':
+        return BinaryEventWriter(file_name, G_DIMENTIONS, static_dimentions,\
+            G_SIZE, write_buffer_bytes())
+    else:
+        return TextEventWriter(file_name, MAX_ACTUALIZATIONS_LIST_SIZE, pool,\
+            processes, G_COMPRESSION, write_buffer_bytes())
+
+def write_outputfiles(events, testcase_num):
+    # Update and expiration events come already ordered from the join, each
+    # block is written to both output files in a single pass. Text is
+    # formatted in a process pool unless testcases already run in parallel.
+    processes = multiprocessing.cpu_count()
+    if G_OUTPUT_FORMAT == 'text' and G_TESTCASES == 1 and processes > 1:
+        pool = multiprocessing.Pool(processes)
+    else:
+        pool = None
+    dyn_writer = new_event_writer('dyn', testcase_num, 0, pool, processes)
+    joined_writer = new_event_writer('joined', testcase_num, G_DIMENTIONS,\
+        pool, processes)
+    with measured('write_joined'):
+        static_table = create_static_table()
 
-def create_dataset(arrivals, splitter, testcase_num=None):
-    kosmann_values = splitter.values_generator()
-    tuples = G_SIZE
-    dims = range(1,G_DIMENTIONS + 1)
-    dim = dims.pop(0)
-    result = []
-    intermediate_file_name = "{0}_intermediate_file".format(get_kossman_filename())
-    intermediate_file = open(intermediate_file_name,'w')
-    file_writer = intermediate_file_writer(result, intermediate_file)
-
-    print_verbose_message('Organizing dataset...\n')
-    t = G_SIZE * G_DIMENTIONS
+    try:
+        for block in events:
+            with measured('write_dyn') as stage:
+                dyn_writer.write(block)
+                stage['events_in'] += len(block)
+            with measured('write_joined') as stage:
+                joined_writer.write(\
+                    insert_static_dims_to_update_events(block, static_table))
+                stage['events_in'] += len(block)
+
+        with measured('write_dyn'):
+            dyn_writer.close()
+        with measured('write_joined'):
+            joined_writer.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+def events_block(ts, ids, dim, values):
+    block = numpy.empty(len(ts), EVENT_DTYPE)
+    block['ts'] = ts
+    block['id'] = ids
+    block['dim'] = dim
+    block['value'] = values
+    return block
+
+
+
+def create_events_block(arrivals, values, first_id, dim,\
+                        random_state=numpy.random):
+    # values has the values of every tuple of the block, one after the other
+    counts = arrivals.astype(numpy.int64)
+    rows = numpy.repeat(numpy.arange(len(counts)), counts)
+
+    ts = generate_timestamps(counts, dim, random_state)
+    mask = ts <= G_SIMULATION_TIME
+
+    return (ts[mask], rows[mask] + first_id, values[mask])
+
+
+def schedule_streams(calendar, streams, next_ts, window):
+    # Streams are only kept while their next arrival is inside the simulation
+    streams = streams[next_ts[streams] <= G_SIMULATION_TIME]
+    buckets = (next_ts[streams] / window).astype(numpy.int64)
+    order = numpy.argsort(buckets, kind='mergesort')
+    streams = streams[order]
+    buckets = buckets[order]
+    starts = numpy.flatnonzero(numpy.diff(buckets)) + 1
+    for start, part in zip(numpy.concatenate(([0], starts)),\
+                           numpy.split(streams, starts)):
+        if len(part):
+            calendar[buckets[start]].append(part)
+
+
+def calendar_events(arrivals, splitter, testcase):
+    # Every (dim, tuple) pair is an independent stream of increasing
+    # timestamps. Streams are kept in a calendar of time windows and each
+    # window is generated and sorted on its own, so events come out in
+    # global timestamp order without sorting the whole dataset. Only the
+    # values of the events of a window are read from the pool.
+    counts = stream_counts(arrivals)
+    starts = numpy.cumsum(counts) - counts
+    gaps = random_state(CALENDAR_STREAM, testcase)
+    scales = numpy.repeat([timestamps_scale(dim)\
+                           for dim in range(0, G_DIMENTIONS)], G_SIZE)
+    window = (G_SIMULATION_TIME * EVENTS_PER_WINDOW) / float(max(counts.sum(), 1))
+    calendar = [[] for i in range(0, int(G_SIMULATION_TIME / window) + 1)]
+
+    next_ts = numpy.zeros(len(counts))
+    emitted = numpy.zeros(len(counts), numpy.int64)
+    streams = numpy.flatnonzero(counts)
+    next_ts[streams] = gaps.exponential(scales[streams])
+    schedule_streams(calendar, streams, next_ts, window)
+
+    for bucket in range(0, len(calendar)):
+        if not calendar[bucket]:
+            continue
+        streams = numpy.concatenate(calendar[bucket])
+        calendar[bucket] = None
+        ts, events, offsets = [], [], []
+
+        while len(streams):
+            # Arrivals after the simulation are dropped, as in
+            # create_events_block
+            streams = streams[next_ts[streams] <= G_SIMULATION_TIME]
+            ts.append(next_ts[streams])
+            events.append(streams)
+            offsets.append(emitted[streams])
+            emitted[streams] += 1
+            streams = streams[emitted[streams] < counts[streams]]
+            next_ts[streams] += gaps.exponential(scales[streams])
+            later = next_ts[streams] >= (bucket + 1) * window
+            schedule_streams(calendar, streams[later], next_ts, window)
+            streams = streams[~later]
+
+        events = numpy.concatenate(events)
+        block = events_block(numpy.concatenate(ts), events % G_SIZE,\
+            events // G_SIZE, splitter.stream_values(starts, events,\
+            numpy.concatenate(offsets)))
+        yield block[sort_order(block, EVENT_KEYS)]
+
+
+def dataset_blocks(arrivals, splitter, testcase, first_id=0, last_id=None):
+    # Every block of tuples of a dimention draws its timestamps from its own
+    # stream, so any range of blocks can be generated on its own
+    if last_id is None:
+        last_id = G_SIZE
+    t = (last_id - first_id) * G_DIMENTIONS
     s = 0
-    act_count = 0
+    counts = stream_counts(arrivals)
+    starts = numpy.cumsum(counts) - counts
     for dim in range(0,G_DIMENTIONS):
-        tuple_arr = arrivals.pop(0)
-        for tuple_id in range(0,G_SIZE):
-            values = kosmann_values.next()
-            arr = tuple_arr.pop(0)
-            timestamps = generate_timestamps(arr,dim)
-
-            s = s + 1
+        splitter.seek(stream_row(splitter, starts, dim * G_SIZE + first_id))
+        for block_id in range(first_id, last_id, TUPLES_PER_BLOCK):
+            block_arr = arrivals[dim][block_id:\
+                min(block_id + TUPLES_PER_BLOCK, last_id)]
+            values = splitter.next_values(block_arr)
+            ts, ids, vals = create_events_block(block_arr, values,\
+                block_id, dim, random_state(TIMESTAMPS_STREAM, testcase, dim,\
+                block_id / TUPLES_PER_BLOCK))
+            yield events_block(ts, ids, dim, vals)
+
+            s = s + len(block_arr)
             p = (s * 100) / t
             print_verbose_message('\r{0}%'.format(p))
 
-            for i in range(0,arr):
-                val = values.pop(0)
-                ts = timestamps.pop(0)
-                if ts <= G_SIMULATION_TIME:
-                    result.append((ts, tuple_id, dim, float(val),))
-                    act_count += 1
-                    file_writer.next()
-
     print_verbose_message('\r done.\n')
-    intermediate_file.close()
 
-    prepare_outputfile(intermediate_file_name, testcase_num, act_count)
-    os.system("rm {0}".format(intermediate_file_name))
+def sorted_events(arrivals, splitter, tmp_file_name, testcase=0):
+    if G_SORT_FREE:
+        print_verbose_message('Organizing dataset by time windows...\n')
+        for block in stage_blocks('calendar',\
+                calendar_events(arrivals, splitter, testcase), 'join'):
+            yield block
+        return
+
+    events = new_event_sorter(EVENT_DTYPE, EVENT_KEYS, tmp_file_name, G_SIZE)
+    try:
+        if stage_done('sort'):
+            print_verbose_message('Using sorted dataset of the last run.\n')
+            events.resume(CHECKPOINT.files('sort'))
+        else:
+            print_verbose_message('Organizing dataset...\n')
+            for block in stage_blocks('events',\
+                    dataset_blocks(arrivals, splitter, testcase), 'sort'):
+                with measured('sort'):
+                    events.add(block)
+
+            print_verbose_message('Sorting dataset...')
+            with measured('sort'):
+                events.sort()
+                if CHECKPOINT is not None:
+                    complete_stage('sort', events.save_runs(),\
+                        intermediate=True)
+            print_verbose_message(' done.\n')
+
+        for block in stage_blocks('merge', events.sorted_blocks(), 'join'):
+            yield block
+    finally:
+        # Checkpointed runs are kept until the output is complete
+        events.cleanup(remove_runs=CHECKPOINT is None)
+
+def create_dataset(arrivals, splitter, testcase_num=None):
+    if testcase_num is None:
+        tmp_file_name = "{0}_intermediate_file".format(get_kossman_filename())
+    else:
+        tmp_file_name = "{0}_intermediate_file{1}".format(\
+            get_kossman_filename(), testcase_num)
+    prepare_outputfile(sorted_events(arrivals, splitter, tmp_file_name,\
+        testcase_num or 0), testcase_num)
+
+def create_testcase(arrivals, testcase_num, processes, pool_start):
+    # Runs in its own process: reads its own values of the shared pool and
+    # the memory budget is split between the testcases. Only the main
+    # process records completed stages.
+    global G_VERBOSE
+    global G_MEMORY_BUDGET
+    global CHECKPOINT
+    G_VERBOSE = False
+    G_MEMORY_BUDGET = G_MEMORY_BUDGET / float(processes)
+    CHECKPOINT = None
+    detach_telemetry()
+
+    splitter = pool_splitter(testcase_num, pool_start)
+    create_dataset(arrivals, splitter, testcase_num)
+    splitter.cleanup()
+
+def generate_testcases(arrival_arr):
+    processes = min(G_TESTCASES, multiprocessing.cpu_count())
+
+    print_verbose_message('Generating {0} testcases in {1} processes...\n'.\
+        format(G_TESTCASES, processes))
+    names = ['Testcase {0}'.format(testcase)\
+             for testcase in range(0, G_TESTCASES)]
+    starts = pool_starts(arrival_arr)
+    with measured('testcases'):
+        run_processes(create_testcase, [(names[testcase],\
+            (arrival_arr[testcase], testcase, processes, starts[testcase]))\
+            for testcase in range(0, G_TESTCASES)\
+            if not stage_done(names[testcase])], processes,\
+            dict((names[testcase], event_file_names(testcase))\
+                 for testcase in range(0, G_TESTCASES)))
+
+def run_processes(target, tasks, processes, stage_files, intermediate=False):
+    # Tasks are not run in a multiprocessing.Pool since its workers are
+    # daemonic and could not start the processes of an external sort. Each
+    # task is a stage, completed with its files when the process ends.
+    # When one fails the others are stopped before the error is raised.
+    running = []
+    try:
+        for name, args in tasks:
+            if len(running) == processes:
+                wait_process(running[0], stage_files, intermediate)
+                running.pop(0)
+            process = multiprocessing.Process(target=target, name=name,\
+                args=args)
+            process.start()
+            running.append(process)
+
+        while running:
+            wait_process(running[0], stage_files, intermediate)
+            running.pop(0)
+    finally:
+        for process in running:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+def wait_process(process, stage_files, intermediate):
+    process.join()
+    if process.exitcode != 0:
+        raise Exception('Error: {0} failed'.format(process.name))
+    complete_stage(process.name, stage_files[process.name], intermediate)
+    print_verbose_message('{0} done.\n'.format(process.name))
+
+def shard_count():
+    # Shards run G_WORKERS at a time, there are more of them when the join
+    # state of a shard would not fit in its process share of the budget
+    process_budget = memory_budget_bytes() / float(G_WORKERS)
+    shards = int(math.ceil(join_state_bytes(G_SIZE, G_DIMENTIONS) /\
+        (process_budget * JOIN_MEMORY_SHARE)))
+    return max(G_WORKERS, shards)
+
+def sharded():
+    return not G_SORT_FREE and G_TESTCASES == 1 and shard_count() > 1
+
+def shard_bounds():
+    # Shards are made of whole blocks of tuples so they draw the same
+    # timestamps a single process would
+    blocks = (G_SIZE + TUPLES_PER_BLOCK - 1) / TUPLES_PER_BLOCK
+    shards = shard_count()
+    shard_size = ((blocks + shards - 1) / shards) * TUPLES_PER_BLOCK
+    return [(first_id, min(first_id + shard_size, G_SIZE))\
+            for first_id in range(0, G_SIZE, shard_size)]
+
+def create_shard(arrivals, first_id, last_id, shard_file_name):
+    # Runs in its own process: generates, sorts and joins the events of the
+    # tuple ids of the shard and leaves them ordered in the shard file
+    global G_VERBOSE
+    global G_MEMORY_BUDGET
+    global CHECKPOINT
+    G_VERBOSE = False
+    G_MEMORY_BUDGET = G_MEMORY_BUDGET / float(G_WORKERS)
+    CHECKPOINT = None
+    detach_telemetry()
+
+    splitter = pool_splitter()
+    events = new_event_sorter(EVENT_DTYPE, EVENT_KEYS,\
+        '{0}_intermediate_file'.format(shard_file_name), last_id - first_id)
+    # The join state only covers the ids of the shard
+    for block in dataset_blocks(arrivals, splitter, 0, first_id, last_id):
+        block['id'] -= first_id
+        events.add(block)
+    splitter.cleanup()
+
+    joiner = EventJoiner(last_id - first_id, G_DIMENTIONS, tuples_ttl(),\
+        G_SIMULATION_TIME)
+    with open(shard_file_name, 'wb') as shard_file:
+        for block in joiner.ordered_events(events.sorted_blocks()):
+            block['id'] += first_id
+            block.tofile(shard_file)
+    events.cleanup()
+
+def shard_events(arrivals):
+    bounds = shard_bounds()
+    shard_file_names = ['{0}_shard{1}'.format(get_kossman_filename(), i)\
+                        for i in range(0, len(bounds))]
+
+    names = ['Shard {0}'.format(i) for i in range(0, len(bounds))]
+
+    try:
+        print_verbose_message('Generating {0} shards...\n'.format(len(bounds)))
+        with measured('shards'):
+            run_processes(create_shard, [(names[i], (arrivals, bounds[i][0],\
+                bounds[i][1], shard_file_names[i]))\
+                for i in range(0, len(bounds)) if not stage_done(names[i])],\
+                G_WORKERS, dict((names[i], [shard_file_names[i]])\
+                for i in range(0, len(bounds))), intermediate=True)
+
+        print_verbose_message('Merging shards...\n')
+        shards = [numpy.memmap(file_name, output_dtype(G_DIMENTIONS),\
+                  mode='r') for file_name in shard_file_names\
+                  if os.path.getsize(file_name)]
+        for block in stage_blocks('merge', merge_sorted_blocks(\
+                [run_blocks(shard, TUPLES_PER_BLOCK) for shard in shards],\
+                OUTPUT_KEYS)):
+            yield block
+        del shards
+    finally:
+        # Checkpointed shards are kept until the output is complete
+        if CHECKPOINT is None:
+            for file_name in shard_file_names:
+                if os.path.isfile(file_name):
+                    os.remove(file_name)
 
 def generate_datasets(arrival_arr):
-    if G_TESTCASES != 1:
-        testcase = 0
-        for arrival in arrival_arr:
-            splitter = KosmannSplitter(get_kossman_filename(),\
-                MAX_INTERMEDIATE_FILE_SIZE_GB, G_VERBOSE)
-            randomize_file()
-            create_dataset(arrival, splitter, testcase)
-            splitter.cleanup()
-            testcase = testcase + 1
+    if sharded():
+        write_outputfiles(shard_events(arrival_arr.pop()), None)
+    elif G_TESTCASES != 1:
+        generate_testcases(arrival_arr)
     else:
-        splitter = KosmannSplitter(get_kossman_filename(),\
-            MAX_INTERMEDIATE_FILE_SIZE_GB, G_VERBOSE)
-        randomize_file()
+        splitter = pool_splitter(processes=multiprocessing.cpu_count())
         create_dataset(arrival_arr.pop(),splitter)
         splitter.cleanup()
 
+    if CHECKPOINT is not None:
+        complete_stage('output', [file_name\
+            for testcase_num in testcase_numbers()\
+            for file_name in event_file_names(testcase_num)])
+        CHECKPOINT.remove_intermediate()
+
     if G_DELETE_TMP:
             os.system('rm {0}'.format(get_kossman_filename()))
 
-def generate_static_dataset():
-    if not os.path.isfile(get_path(GENERATOR)):
-        raise Exception('Error: kossman generator does exist')
-
-    if not os.path.isfile(get_path('generador')):
-        os.system('g++ {0} -o {1}'.format(get_path(GENERATOR),get_path('generator')))
+def testcase_numbers():
+    if G_TESTCASES == 1:
+        return [None]
+    return range(0, G_TESTCASES)
 
+def static_dimentions():
     if G_STATICDIMS:
-        dimentions = G_STATICDIMS
+        return G_STATICDIMS
     else:
-        dimentions = G_DIMENTIONS
+        return G_DIMENTIONS
+
+def generate_static_dataset():
+    if stage_done('static'):
+        print_verbose_message('Using static file of the last run.\n')
+        return
 
     print_verbose_message('Creating static file with Kossmann generator...')
-    os.system('{0} {1} {2} {3} {4} > /dev/null'.format(\
-        get_path('generator'), dimentions, 'E',G_SIZE,
-        '{0}_static'.format(G_OUTPUTFILE)))
+    with measured('static') as stage:
+        kosmann_generator.write_data('{0}_static'.format(G_OUTPUTFILE),\
+            static_dimentions(), 'E', G_SIZE, header=True,\
+            random_state=random_state(STATIC_STREAM))
+        stage['events_out'] += G_SIZE
+    complete_stage('static', ['{0}_static'.format(G_OUTPUTFILE)])
     print_verbose_message(' done.\n')
 
+def generate_arrivals():
+    if not G_ARRIVALS:
+        return generate_poisson_arrivals()
+    else:
+        return generate_fixed_arrivals()
+
+def run_parameters():
+    # Parsed options of the run (and the generator of their random defaults)
+    names = [name for name in globals() if name.startswith('G_')]
+    return dict((name, globals()[name])\
+                for name in names + ['DEFAULTS_RANDOM'])
+
+def set_run_parameters(parameters):
+    globals().update(parameters)
+
+def stream_events(argv, joined=True, batch_size=SORTED_BLOCK_SIZE):
+    # Library entry point: yields the update and expiration events of a
+    # dataset in time order, as structured arrays of at most batch_size
+    # events (see event_sorter.output_dtype), without writing output files.
+    # argv takes the same options as the command line but -o is not needed.
+    # With joined the static values are appended to the update events.
+    # Events are generated lazily, with --sortfree the first ones are
+    # yielded as soon as their time window is generated. The options of the
+    # stream are only in place while it runs, so several streams (and runs)
+    # can be interleaved, and it never asks for confirmation.
+    global G_TMP_FILE
+    caller = run_parameters()
+    parsed = False
+    splitter = None
+    try:
+        options = get_options(argv)
+        check_options(options, output=False)
+        parse_input(options)
+        parsed = True
+        if G_TESTCASES != 1:
+            raise NotImplementedError('Only one testcase can be streamed.')
+        if G_RESUME is None:
+            tmp_file, G_TMP_FILE = tempfile.mkstemp(prefix='tmp_',\
+                dir=dirname(abspath(__file__)))
+            os.close(tmp_file)
+
+        arrival_arr = generate_arrivals()
+        arrivals = arrival_arr[0]
+        if joined:
+            # With the decimals the static file would have
+            static_table = numpy.around(kosmann_generator.generate_data(\
+                static_dimentions(), 'E', G_SIZE,\
+                random_state=random_state(STATIC_STREAM))[:, :G_DIMENTIONS],\
+                kosmann_generator.VALUE_DECIMALS)
+        call_kossman(arrival_arr, interactive=False)
+
+        if sharded():
+            events = shard_events(arrivals)
+        else:
+            splitter = pool_splitter(processes=multiprocessing.cpu_count())
+            events = single_tuple_events(sorted_events(arrivals, splitter,\
+                "{0}_intermediate_file".format(get_kossman_filename())))
+
+        for block in fixed_size_blocks(events, batch_size):
+            if joined:
+                block = insert_static_dims_to_update_events(block,\
+                    static_table)
+            parameters = run_parameters()
+            set_run_parameters(caller)
+            try:
+                yield block
+            finally:
+                caller = run_parameters()
+                set_run_parameters(parameters)
+    finally:
+        if splitter is not None:
+            splitter.cleanup()
+        if parsed and G_DELETE_TMP and\
+           os.path.isfile(get_kossman_filename()):
+            os.remove(get_kossman_filename())
+        set_run_parameters(caller)
+
 def main(argv):
     options = get_options(argv)
     check_options(options)
     parse_input(options)
+    if G_CHECKPOINT:
+        start_checkpoint(options)
+    if G_TELEMETRY:
+        start_telemetry()
 
-    if not G_ARRIVALS:
-        arrival_arr = generate_poisson_arrivals()
-    else:
-        arrival_arr = generate_fixed_arrivals()
+    completed = False
+    try:
+        build()
+        completed = True
+    finally:
+        if TELEMETRY is not None:
+            write_telemetry(options, completed)
+
+def build():
+    with measured('arrivals') as stage:
+        arrival_arr = generate_arrivals()
+        stage['events_out'] += sum(int(arrivals.sum())\
+            for testcase_arrivals in arrival_arr\
+            for arrivals in testcase_arrivals)
+    if CHECKPOINT is not None:
+        checkpoint_arrivals(arrival_arr)
 
     if G_VERBOSE or G_LEAVE_REPORT or G_LEAVE_SETTINGS:
         report_input()
         report_settings()
 
+    if stage_done('output') and (not G_STATICDATA or stage_done('static')):
+        print_verbose_message('Output of the last run is complete.\n')
+        return
+
     if G_STATICDATA:
         generate_static_dataset()
 
-    call_kossman()
+    call_kossman(arrival_arr)
 
     generate_datasets(arrival_arr)
 
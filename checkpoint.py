@@ -0,0 +1,96 @@
+import os, json, zlib, numpy
+
+# Files are checksummed in chunks of this many bytes
+CHECKSUM_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def file_checksum(file_name):
+    checksum = 0
+    with open(file_name, 'rb') as in_file:
+        while True:
+            chunk = in_file.read(CHECKSUM_CHUNK_BYTES)
+            if not chunk:
+                break
+            checksum = zlib.crc32(chunk, checksum)
+    return checksum & 0xffffffff
+
+
+def data_checksum(arrays):
+    checksum = 0
+    for array in arrays:
+        checksum = zlib.crc32(numpy.ascontiguousarray(array).tostring(),\
+            checksum)
+    return checksum & 0xffffffff
+
+
+class Checkpoint():
+
+    # Manifest of the completed stages of a run, saved as json every time a
+    # stage completes. A stage is still done on a later run with the same
+    # parameters if its files have the size and checksum recorded.
+
+    def __init__(self, manifest_file_name, parameters):
+        self.manifest_file_name = manifest_file_name
+        self.parameters = parameters
+        self.seed = None
+        self.stages = {}
+        if os.path.isfile(manifest_file_name):
+            with open(manifest_file_name) as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest['parameters'] == parameters:
+                self.seed = manifest['seed']
+                self.stages = manifest['stages']
+
+    def done(self, stage, checksum=None):
+        if stage not in self.stages:
+            return False
+        if checksum is not None and self.stages[stage]['checksum'] != checksum:
+            return False
+        for file_name, size, file_crc in self.stages[stage]['files']:
+            if not os.path.isfile(file_name) or\
+               os.path.getsize(file_name) != size or\
+               file_checksum(file_name) != file_crc:
+                return False
+        return True
+
+    def files(self, stage):
+        return [file_name for file_name, size, file_crc\
+                in self.stages[stage]['files']]
+
+    def complete(self, stage, file_names=(), checksum=None,\
+                 intermediate=False):
+        self.stages[stage] = {
+            'files' : [[file_name, os.path.getsize(file_name),\
+                        file_checksum(file_name)] for file_name in file_names],
+            'checksum' : checksum,
+            'intermediate' : intermediate
+        }
+        self.save()
+
+    def remove(self, stage):
+        # Drops the stage and deletes its files
+        if stage not in self.stages:
+            return
+        for file_name in self.files(stage):
+            if os.path.isfile(file_name):
+                os.remove(file_name)
+        del self.stages[stage]
+        self.save()
+
+    def remove_intermediate(self):
+        for stage in [stage for stage in self.stages\
+                      if self.stages[stage]['intermediate']]:
+            self.remove(stage)
+
+    def reset(self):
+        self.stages = {}
+        self.save()
+
+    def save(self):
+        # Written aside and renamed, so a run killed while saving leaves the
+        # previous manifest
+        tmp_file_name = self.manifest_file_name + '.tmp'
+        with open(tmp_file_name, 'w') as manifest_file:
+            json.dump({'parameters' : self.parameters, 'seed' : self.seed,\
+                       'stages' : self.stages}, manifest_file, indent=1)
+        os.rename(tmp_file_name, self.manifest_file_name)
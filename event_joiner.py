@@ -0,0 +1,211 @@
+import collections, numpy
+from event_sorter import OUTPUT_KEYS, output_dtype, output_block, sort_order
+
+EXPIRATION_EVENT = 0
+UPDATE_EVENT = 1
+
+
+def join_state_bytes(size, dimentions):
+    # Memory of the join state arrays of EventJoiner
+    return size * (dimentions * 8 + 2 + 8)
+
+
+class EventJoiner():
+
+    # Join state of every tuple id, kept in preallocated arrays: the last
+    # value received for each dimention, a bitmask of the dimentions that
+    # arrived since the last update event and the current expiration time
+    # (infinite while the tuple has not been updated yet).
+
+    def __init__(self, size, dimentions, ttl, simulation_time):
+        self.size = size
+        self.dimentions = dimentions
+        self.ttl = ttl
+        self.simulation_time = simulation_time
+        self.complete_mask = (1 << dimentions) - 1
+        self.pending = numpy.zeros((size, dimentions))
+        self.arrived = numpy.zeros(size, numpy.uint16)
+        self.current_expiration = numpy.empty(size)
+        self.current_expiration.fill(numpy.inf)
+        self.dtype = output_dtype(dimentions)
+        # Expirations waiting to be decided, in increasing time order since
+        # updates arrive ordered
+        self.expiration_queue = collections.deque()
+
+    def join_block(self, block):
+        # Events are regrouped by id (keeping their time order) and every
+        # update event of the block is found with group-wise operations. Only
+        # the join state of the ids is carried from one block to the next.
+        n = len(block)
+        if not n:
+            return ((numpy.empty(0), numpy.empty(0, numpy.int64),\
+                     numpy.empty((0, self.dimentions))),\
+                    (numpy.empty(0), numpy.empty(0, numpy.int64)))
+        dims_range = numpy.arange(self.dimentions)
+        order = numpy.argsort(block['id'], kind='mergesort')
+        ids = block['id'][order]
+        dims = block['dim'][order].astype(numpy.int64)
+        vals = block['value'][order]
+        ts = block['ts'][order]
+        positions = numpy.arange(n)
+
+        starts = numpy.flatnonzero(numpy.r_[True, ids[1:] != ids[:-1]])
+        ends = numpy.r_[starts[1:], n]
+        group_ids = ids[starts]
+        group_of = numpy.repeat(numpy.arange(len(starts)), ends - starts)
+
+        # Next and previous position of every dimention from each event,
+        # positions that fall in another group are discarded when used
+        is_dim = dims[:, None] == dims_range
+        next_occ = numpy.where(is_dim, positions[:, None], n)
+        next_occ = numpy.minimum.accumulate(next_occ[::-1], axis=0)[::-1]
+        prev_occ = numpy.where(is_dim, positions[:, None], -1)
+        prev_occ = numpy.maximum.accumulate(prev_occ, axis=0)
+
+        carried = self.arrived[group_ids].astype(numpy.int64)
+        known = ((carried[:, None] >> dims_range) & 1).astype(bool)
+
+        # Each round finds the next update event of every group, which is
+        # where the last missing dimention arrives
+        complete_pos, complete_group, complete_start = [], [], []
+        groups = numpy.arange(len(starts))
+        round_start = starts
+        while len(groups):
+            complete_at = numpy.where(known, -1, next_occ[round_start]).max(axis=1)
+            done = complete_at < ends[groups]
+            groups = groups[done]
+            complete_pos.append(complete_at[done])
+            complete_group.append(groups)
+            complete_start.append(round_start[done])
+
+            round_start = complete_at[done] + 1
+            more = round_start < ends[groups]
+            groups = groups[more]
+            round_start = round_start[more]
+            known = numpy.zeros((len(groups), self.dimentions), bool)
+
+        pos = numpy.concatenate(complete_pos)
+        by_group = numpy.argsort(pos, kind='mergesort')
+        pos = pos[by_group]
+        grp = numpy.concatenate(complete_group)[by_group]
+        start = numpy.concatenate(complete_start)[by_group]
+        update_ts = ts[pos]
+        update_ids = group_ids[grp]
+
+        # Latest value of each dimention, or the carried one when the
+        # dimention arrived in a previous block
+        last = prev_occ[pos]
+        update_values = numpy.where(last >= start[:, None],\
+            vals[last.clip(0)], self.pending[update_ids])
+
+        first_of_group = numpy.ones(len(grp), bool)
+        first_of_group[1:] = grp[1:] != grp[:-1]
+        last_of_group = numpy.ones(len(grp), bool)
+        last_of_group[:-1] = grp[1:] != grp[:-1]
+        old_exp = numpy.empty(len(pos))
+        old_exp[1:] = update_ts[:-1] + self.ttl
+        old_exp[first_of_group] = self.current_expiration[\
+            update_ids[first_of_group]]
+        expire = ((update_ts - old_exp) >= self.ttl) &\
+            (old_exp < self.simulation_time)
+        expirations = (old_exp[expire], update_ids[expire])
+
+        self.current_expiration[update_ids[last_of_group]] =\
+            update_ts[last_of_group] + self.ttl
+        self.carry_state(group_ids, starts, ends, group_of, dims, vals,\
+            prev_occ, carried, grp[last_of_group], pos[last_of_group])
+
+        time_order = numpy.argsort(order[pos], kind='mergesort')
+        updates = (update_ts[time_order], update_ids[time_order],\
+                   update_values[time_order])
+        return (updates, expirations)
+
+    def carry_state(self, group_ids, starts, ends, group_of, dims, vals,\
+                    prev_occ, carried, updated_groups, last_update_pos):
+        last_update = numpy.empty(len(starts), numpy.int64)
+        last_update.fill(-1)
+        last_update[updated_groups] = last_update_pos
+
+        after_update = numpy.arange(len(dims)) > last_update[group_of]
+        arrived = numpy.zeros((len(starts), self.dimentions), bool)
+        arrived[group_of[after_update], dims[after_update]] = True
+        mask = numpy.where(last_update < 0, carried, 0) |\
+            (arrived * (1 << numpy.arange(self.dimentions))).sum(axis=1)
+        self.arrived[group_ids] = mask
+
+        last = prev_occ[ends - 1]
+        groups, dims_seen = numpy.nonzero(last >= starts[:, None])
+        self.pending[group_ids[groups], dims_seen] = vals[last[groups, dims_seen]]
+
+    def final_expirations(self):
+        ids = numpy.flatnonzero(self.current_expiration <= self.simulation_time)
+        return (self.current_expiration[ids], ids)
+
+    def schedule_expirations(self, updates):
+        ts, ids, values = updates
+        if len(ts):
+            self.expiration_queue.append((ts + self.ttl, ids))
+
+    def decided_expirations(self, watermark):
+        # An expiration is decided once its tuple went a whole ttl after it
+        # without updates: the next update (if any) will expire it anyway.
+        # Entries whose tuple was updated (or expired) meanwhile are dropped.
+        expiration_ts, expiration_ids = [], []
+        while self.expiration_queue:
+            exp, ids = self.expiration_queue[0]
+            cut = numpy.searchsorted(exp + self.ttl, watermark, side='right')
+            valid = (self.current_expiration[ids[:cut]] == exp[:cut]) &\
+                (exp[:cut] < self.simulation_time)
+            expiration_ts.append(exp[:cut][valid])
+            expiration_ids.append(ids[:cut][valid])
+            self.current_expiration[ids[:cut][valid]] = numpy.inf
+            if cut < len(exp):
+                self.expiration_queue[0] = (exp[cut:], ids[cut:])
+                break
+            self.expiration_queue.popleft()
+
+        if not expiration_ts:
+            return (numpy.empty(0), numpy.empty(0, numpy.int64))
+        return (numpy.concatenate(expiration_ts),\
+                numpy.concatenate(expiration_ids))
+
+    def expiration_horizon(self):
+        if self.expiration_queue:
+            return self.expiration_queue[0][0][0]
+        return numpy.inf
+
+    def update_events(self, updates):
+        ts, ids, values = updates
+        return output_block(self.dtype, ts, UPDATE_EVENT, ids, values)
+
+    def expiration_events(self, expirations):
+        ts, ids = expirations
+        return output_block(self.dtype, ts, EXPIRATION_EVENT, ids)
+
+    def ordered_events(self, blocks):
+        # Output events are held back only while an earlier expiration may
+        # still be pending, everything before the expiration horizon is
+        # emitted in (ts, type, id) order, so no sort is needed afterwards.
+        held = numpy.empty(0, self.dtype)
+
+        for block in blocks:
+            if not len(block):
+                continue
+            updates, expirations = self.join_block(block)
+            self.schedule_expirations(updates)
+            decided = self.decided_expirations(block['ts'][-1])
+            held = numpy.concatenate((held, self.update_events(updates),\
+                self.expiration_events(expirations),\
+                self.expiration_events(decided)))
+
+            # Later blocks may still bring updates at the last timestamp
+            horizon = min(self.expiration_horizon(), block['ts'][-1])
+            held = held[sort_order(held, OUTPUT_KEYS)]
+            cut = numpy.searchsorted(held['ts'], horizon)
+            yield held[:cut]
+            held = held[cut:]
+
+        self.expiration_queue.clear()
+        held = numpy.concatenate((held,\
+            self.expiration_events(self.final_expirations())))
+        yield held[sort_order(held, OUTPUT_KEYS)]
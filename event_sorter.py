@@ -0,0 +1,238 @@
+import os, heapq, multiprocessing, numpy
+
+# Events produced by create_dataset, sorted by timestamp, id and dimention
+EVENT_DTYPE = numpy.dtype([('ts', 'f8'), ('id', 'i8'), ('dim', 'i4'),\
+                           ('value', 'f8')])
+EVENT_KEYS = ['ts', 'id', 'dim']
+
+# Update and expiration events, sorted by timestamp, type and id
+OUTPUT_KEYS = ['ts', 'type', 'id']
+
+# Sorting in memory needs the events, their sorted copy and the sort index
+SORT_INDEX_BYTES = 8
+SORTED_BLOCK_SIZE = 65536
+
+
+def output_dtype(values):
+    return numpy.dtype([('ts', 'f8'), ('type', 'u1'), ('id', 'i8'),\
+                        ('values', 'f8', (values,))])
+
+
+def output_block(dtype, ts, event_type, ids, values=None):
+    block = numpy.empty(len(ts), dtype)
+    block['ts'] = ts
+    block['type'] = event_type
+    block['id'] = ids
+    if values is None:
+        block['values'] = numpy.nan
+    else:
+        block['values'] = values
+    return block
+
+
+def sort_order(events, keys):
+    # lexsort uses the last key as the primary one
+    return numpy.lexsort([events[key] for key in reversed(keys)])
+
+
+def sort_run(run_file_name, dtype, keys):
+    run = numpy.fromfile(run_file_name, dtype)
+    run[sort_order(run, keys)].tofile(run_file_name)
+
+
+def run_blocks(run, block_size):
+    for start in xrange(0, len(run), block_size):
+        yield numpy.array(run[start:start + block_size])
+
+
+def fixed_size_blocks(blocks, block_size):
+    buffered = []
+    count = 0
+    for block in blocks:
+        buffered.append(block)
+        count += len(block)
+        if count >= block_size:
+            events = numpy.concatenate(buffered)
+            end = len(events) - len(events) % block_size
+            for start in xrange(0, end, block_size):
+                yield events[start:start + block_size]
+            buffered = [events[end:]]
+            count = len(events) - end
+
+    if count:
+        yield numpy.concatenate(buffered)
+
+
+def merge_sorted_blocks(block_iterators, keys):
+    # Streaming k-way merge of sorted block streams. The heap keeps the open
+    # streams ordered by the last key of their buffered events, everything
+    # buffered before the smallest of those keys can be emitted.
+    block_iterators = [iter(blocks) for blocks in block_iterators]
+    primary = keys[0]
+    buffers = {}
+    exhausted = set()
+    heads = []
+
+    def refill(i):
+        for block in block_iterators[i]:
+            if len(block):
+                if i in buffers:
+                    buffers[i] = numpy.concatenate((buffers[i], block))
+                else:
+                    buffers[i] = block
+                heapq.heappush(heads, (buffers[i][primary][-1], i))
+                return
+        exhausted.add(i)
+
+    for i in range(0, len(block_iterators)):
+        refill(i)
+
+    while buffers:
+        parts = []
+        for i, buf in buffers.items():
+            if heads:
+                cut = numpy.searchsorted(buf[primary], heads[0][0])
+            else:
+                cut = len(buf)
+            if cut:
+                parts.append(buf[:cut])
+                buffers[i] = buf[cut:]
+
+        if heads:
+            bound = heads[0][0]
+            while heads and heads[0][0] == bound:
+                refill(heapq.heappop(heads)[1])
+
+        for i in exhausted:
+            if i in buffers and not len(buffers[i]):
+                del buffers[i]
+
+        if parts:
+            merged = numpy.concatenate(parts)
+            yield merged[sort_order(merged, keys)]
+
+
+class EventSorter():
+
+    def __init__(self, dtype, keys, memory_budget, tmp_file_name,\
+                 processes=None):
+        if list(dtype.names[:len(keys)]) != list(keys):
+            raise Exception('Error: sort keys must be the first event fields')
+
+        self.dtype = dtype
+        self.keys = keys
+        self.memory_budget = memory_budget
+        self.tmp_file_name = tmp_file_name
+        self.processes = processes or multiprocessing.cpu_count()
+        self.in_memory = True
+        self.blocks = []
+        self.blocks_count = 0
+        self.count = 0
+        self.events = None
+        self.sorted = False
+        self.pool = None
+        self.run_file_names = []
+        self.run_results = []
+
+    def memory_needed(self, count):
+        return count * (2 * self.dtype.itemsize + SORT_INDEX_BYTES)
+
+    def run_size(self):
+        # Every process sorts one run while the next one is being collected
+        run_memory = self.memory_budget / (self.processes + 1)
+        return max(SORTED_BLOCK_SIZE, run_memory / self.memory_needed(1))
+
+    def add(self, block):
+        self.count += len(block)
+        self.blocks.append(block)
+        self.blocks_count += len(block)
+
+        if self.in_memory:
+            if self.memory_needed(self.count) > self.memory_budget:
+                self.in_memory = False
+                self.pool = multiprocessing.Pool(self.processes)
+                self.write_runs(self.run_size())
+        elif self.blocks_count >= self.run_size():
+            self.write_runs(self.run_size())
+
+    def write_runs(self, run_size, last=False):
+        events = numpy.concatenate(self.blocks)
+        self.blocks = []
+        self.blocks_count = 0
+
+        for start in xrange(0, len(events), run_size):
+            run = events[start:start + run_size]
+            if len(run) < run_size and not last:
+                self.blocks = [run]
+                self.blocks_count = len(run)
+                break
+            run_file_name = '{0}_run{1}'.format(self.tmp_file_name,\
+                len(self.run_file_names))
+            run.tofile(run_file_name)
+            self.run_file_names.append(run_file_name)
+            self.run_results.append(self.pool.apply_async(sort_run,\
+                (run_file_name, self.dtype, self.keys)))
+
+    def sort(self):
+        if self.sorted:
+            return
+        self.sorted = True
+
+        if self.in_memory:
+            if self.blocks:
+                self.events = numpy.concatenate(self.blocks)
+            else:
+                self.events = numpy.empty(0, self.dtype)
+            self.blocks = []
+            self.events = self.events[sort_order(self.events, self.keys)]
+        else:
+            if self.blocks:
+                self.write_runs(self.run_size(), last=True)
+            self.pool.close()
+            for result in self.run_results:
+                result.get()
+            self.pool.join()
+            self.pool = None
+
+    def save_runs(self):
+        # Leaves the sorted events on disk, in memory sorts are written as a
+        # single run. Returns the run file names, see resume.
+        self.sort()
+        if self.in_memory:
+            run_file_name = '{0}_run0'.format(self.tmp_file_name)
+            self.events.tofile(run_file_name)
+            self.events = None
+            self.in_memory = False
+            self.run_file_names = [run_file_name]
+        return list(self.run_file_names)
+
+    def resume(self, run_file_names):
+        # Sorted runs left by save_runs of a previous sorter
+        self.in_memory = False
+        self.sorted = True
+        self.run_file_names = list(run_file_names)
+
+    def sorted_blocks(self, block_size=SORTED_BLOCK_SIZE):
+        self.sort()
+
+        if self.in_memory:
+            for start in xrange(0, len(self.events), block_size):
+                yield self.events[start:start + block_size]
+        else:
+            runs = [numpy.memmap(run_file_name, self.dtype, mode='r')\
+                    for run_file_name in self.run_file_names]
+            for block in merge_sorted_blocks(\
+                    [run_blocks(run, block_size) for run in runs], self.keys):
+                yield block
+
+    def cleanup(self, remove_runs=True):
+        self.events = None
+        self.blocks = []
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+        if remove_runs:
+            for file_name in self.run_file_names:
+                if os.path.isfile(file_name):
+                    os.remove(file_name)
+        self.run_file_names = []
@@ -0,0 +1,229 @@
+import collections, zlib, bz2, numpy
+from multiprocessing.pool import ThreadPool
+from numpy.lib.format import MAGIC_PREFIX, dtype_to_descr
+from event_joiner import UPDATE_EVENT
+
+# Binary outputs are .npy files of records, their header is written again
+# with the final count when the file is closed
+NPY_HEADER_ALIGNMENT = 64
+NPY_COUNT_DIGITS = 20
+
+# Default size of the file buffer of the writers
+WRITE_BUFFER_BYTES = 16 * 1024 * 1024
+# Blocks being formatted by the pool at the same time, per process
+PENDING_BLOCKS_PER_PROCESS = 2
+
+# Compressed outputs are made of independent blocks of this many
+# uncompressed bytes
+COMPRESSION_BLOCK_BYTES = 4 * 1024 * 1024
+
+
+def gzip_compress(data):
+    # A whole gzip member, members can be concatenated
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+# Codecs and the suffix of the files they write
+COMPRESSORS = {
+    'gzip' : (gzip_compress, '.gz'),
+    'bz2' : (bz2.compress, '.bz2')
+}
+
+try:
+    import lzma
+    COMPRESSORS['xz'] = (lzma.compress, '.xz')
+except ImportError:
+    pass
+
+
+def format_events(block):
+    # Same text as str() of the (ts, type, id, values...) tuple of each
+    # event, the tuples of the whole block are built by zip
+    updates = block['type'] == UPDATE_EVENT
+    events = numpy.empty(len(block), object)
+    update_events = block[updates]
+    events[updates] = map(str, zip(update_events['ts'].tolist(),\
+        update_events['type'].tolist(), update_events['id'].tolist(),\
+        *update_events['values'].T.tolist()))
+    expiration_events = block[~updates]
+    events[~updates] = map(str, zip(expiration_events['ts'].tolist(),\
+        expiration_events['type'].tolist(), expiration_events['id'].tolist()))
+    return events.tolist()
+
+
+def format_lines(block, line_position, events_per_line):
+    # Text of a block of events, the current line already has line_position
+    # events. Complete lines end with a newline.
+    events = format_events(block)
+    parts = []
+    if line_position and events:
+        parts.append(', ')
+    start = 0
+    line_events = events_per_line - line_position
+    while start < len(events):
+        end = start + line_events
+        parts.append(', '.join(events[start:end]))
+        if end <= len(events):
+            parts.append('\n')
+        start = end
+        line_events = events_per_line
+    return ''.join(parts)
+
+
+def record_dtype(dimentions, static_dimentions, size):
+    if size <= numpy.iinfo(numpy.uint32).max:
+        id_type = '<u4'
+    else:
+        id_type = '<u8'
+    fields = [('ts', '<f8'), ('type', 'u1'), ('id', id_type),\
+              ('values', '<f8', (dimentions,))]
+    if static_dimentions:
+        fields.append(('static', '<f8', (static_dimentions,)))
+    return numpy.dtype(fields)
+
+
+def npy_header(dtype, count, length=None):
+    header = "{{'descr': {0}, 'fortran_order': False, 'shape': ({1},), }}".\
+        format(repr(dtype_to_descr(dtype)), count)
+    if length is None:
+        length = len(MAGIC_PREFIX) + 4 + len(header) + NPY_COUNT_DIGITS + 1
+        length += -length % NPY_HEADER_ALIGNMENT
+    header_length = length - len(MAGIC_PREFIX) - 4
+    header = header.ljust(header_length - 1) + '\n'
+    return MAGIC_PREFIX + '\x01\x00' +\
+        numpy.array(header_length, '<u2').tostring() + header
+
+
+class CompressedFile():
+
+    # Data is compressed in independent blocks by a thread pool (the codecs
+    # release the GIL) and written in order. The offsets of every block are
+    # left in <file_name>.index, so the file can be read from any of them.
+
+    def __init__(self, file_name, compression, threads,\
+                 buffer_bytes=WRITE_BUFFER_BYTES):
+        self.output_f = open(file_name, 'wb', buffer_bytes)
+        self.index_file_name = file_name + '.index'
+        self.compress = COMPRESSORS[compression][0]
+        self.pool = ThreadPool(threads)
+        self.max_pending = threads * PENDING_BLOCKS_PER_PROCESS
+        self.pending = collections.deque()
+        self.buffered = []
+        self.buffered_bytes = 0
+        self.offsets = []
+        self.uncompressed_offset = 0
+        self.compressed_offset = 0
+
+    def write(self, data):
+        # Large writes are split, so no block is over COMPRESSION_BLOCK_BYTES
+        start = 0
+        while start < len(data):
+            part = data[start:start + COMPRESSION_BLOCK_BYTES -\
+                self.buffered_bytes]
+            self.buffered.append(part)
+            self.buffered_bytes += len(part)
+            start += len(part)
+            if self.buffered_bytes >= COMPRESSION_BLOCK_BYTES:
+                self.flush_block()
+
+    def flush_block(self):
+        if not self.buffered_bytes:
+            return
+        data = ''.join(self.buffered)
+        self.buffered = []
+        self.buffered_bytes = 0
+        self.pending.append((len(data),\
+            self.pool.apply_async(self.compress, (data,))))
+        while len(self.pending) > self.max_pending or\
+              (self.pending and self.pending[0][1].ready()):
+            self.write_block()
+
+    def write_block(self):
+        size, result = self.pending.popleft()
+        compressed = result.get()
+        self.offsets.append((self.uncompressed_offset, self.compressed_offset))
+        self.output_f.write(compressed)
+        self.uncompressed_offset += size
+        self.compressed_offset += len(compressed)
+
+    def close(self):
+        self.flush_block()
+        while self.pending:
+            self.write_block()
+        self.pool.terminate()
+        self.output_f.close()
+        with open(self.index_file_name, 'w') as index_file:
+            for offsets in self.offsets:
+                index_file.write('{0} {1}\n'.format(*offsets))
+
+
+class TextEventWriter():
+
+    # Blocks are formatted whole, by the pool processes when a pool is
+    # given, and written in order with a single write each
+
+    def __init__(self, file_name, events_per_line, pool=None, processes=1,\
+                 compression=None, buffer_bytes=WRITE_BUFFER_BYTES):
+        if compression is None:
+            self.output_f = open(file_name, 'w', buffer_bytes)
+        else:
+            self.output_f = CompressedFile(file_name, compression, processes,\
+                buffer_bytes)
+        self.events_per_line = events_per_line
+        self.line_position = 0
+        self.pool = pool
+        self.max_pending = processes * PENDING_BLOCKS_PER_PROCESS
+        self.pending = collections.deque()
+
+    def write(self, block):
+        args = (block, self.line_position, self.events_per_line)
+        self.line_position = (self.line_position + len(block)) %\
+            self.events_per_line
+        if self.pool is None:
+            self.output_f.write(format_lines(*args))
+            return
+
+        self.pending.append(self.pool.apply_async(format_lines, args))
+        while len(self.pending) > self.max_pending or\
+              (self.pending and self.pending[0].ready()):
+            self.output_f.write(self.pending.popleft().get())
+
+    def close(self):
+        while self.pending:
+            self.output_f.write(self.pending.popleft().get())
+        if self.line_position:
+            self.output_f.write('\n')
+        self.output_f.close()
+
+
+class BinaryEventWriter():
+
+    # Events are written as records of record_dtype in a .npy file, so the
+    # whole output can be loaded with numpy.load(file_name, mmap_mode='r')
+
+    def __init__(self, file_name, dimentions, static_dimentions, size,\
+                 buffer_bytes=WRITE_BUFFER_BYTES):
+        self.output_f = open(file_name, 'wb', buffer_bytes)
+        self.dimentions = dimentions
+        self.dtype = record_dtype(dimentions, static_dimentions, size)
+        self.count = 0
+        self.header_length = len(npy_header(self.dtype, 0))
+        self.output_f.write(npy_header(self.dtype, 0))
+
+    def write(self, block):
+        records = numpy.empty(len(block), self.dtype)
+        records['ts'] = block['ts']
+        records['type'] = block['type']
+        records['id'] = block['id']
+        records['values'] = block['values'][:, :self.dimentions]
+        if 'static' in self.dtype.names:
+            records['static'] = block['values'][:, self.dimentions:]
+        records.tofile(self.output_f)
+        self.count += len(records)
+
+    def close(self):
+        self.output_f.seek(0)
+        self.output_f.write(npy_header(self.dtype, self.count,\
+            self.header_length))
+        self.output_f.close()
@@ -0,0 +1,191 @@
+import numpy
+from numpy.lib.format import open_memmap
+
+# Rows are generated (and rejected) in blocks of this many rows
+BLOCK_ROWS = 65536
+
+# Values are written with this many decimals, as in the text files of the
+# original generator (%8.6f)
+VALUE_DECIMALS = 6
+
+# Stream pools are generated in blocks of rows of about this many values
+POOL_BLOCK_VALUES = 1024 * 1024
+
+# Text data files are parsed in chunks of this many bytes
+READ_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+# Vectorized port of the Kossmann skyline data generator (generador.cpp).
+# Every function works over a whole block of rows at once, 'low' and 'high'
+# may be arrays that broadcast against 'shape'. Values are drawn from
+# 'random_state', a numpy RandomState (or the numpy.random module).
+
+def random_equal(low, high, shape, random_state):
+    return random_state.random_sample(shape) * (high - low) + low
+
+
+def random_peak(low, high, dim, shape, random_state):
+    acum = numpy.zeros(shape)
+    for i in range(0, dim):
+        acum += random_state.random_sample(shape)
+    return (acum / dim) * (high - low) + low
+
+
+def random_normal(med, var, shape, random_state):
+    return random_peak(med - var, med + var, 12, shape, random_state)
+
+
+def equally_rows(count, dimentions, random_state):
+    return random_equal(0.0, 1.0, (count, dimentions), random_state)
+
+
+def correlated_rows(count, dimentions, random_state):
+    v = random_peak(0.0, 1.0, dimentions, (count, 1), random_state)
+    l = numpy.minimum(v, 1.0 - v)
+    h = random_normal(0.0, l, (count, dimentions), random_state)
+    # x[d] += h[d] and x[d + 1] -= h[d] for every d
+    return v + h - numpy.roll(h, 1, axis=1)
+
+
+def anticorrelated_rows(count, dimentions, random_state):
+    v = random_normal(0.5, 0.25, (count, 1), random_state)
+    l = numpy.minimum(v, 1.0 - v)
+    h = random_equal(-l, l, (count, dimentions), random_state)
+    return v + h - numpy.roll(h, 1, axis=1)
+
+
+ROW_GENERATORS = {
+    'E' : equally_rows,
+    'C' : correlated_rows,
+    'A' : anticorrelated_rows
+}
+
+
+def check_parameters(dimentions, distribution, count):
+    if count <= 0:
+        raise Exception('Error: invalid amount of kossmann points')
+    if dimentions < 2:
+        raise Exception('Error: invalid amount of kossmann dimentions')
+    if distribution.upper() not in ROW_GENERATORS:
+        raise Exception('Error: invalid kossmann distribution')
+
+
+def fill_rows(out, distribution, random_state=numpy.random):
+    row_generator = ROW_GENERATORS[distribution.upper()]
+    count, dimentions = out.shape
+    filled = 0
+
+    while filled < count:
+        rows = row_generator(min(BLOCK_ROWS, count - filled), dimentions,\
+            random_state)
+        # Rows outside the unit cube are generated again (the 'goto again'
+        # of the original generator)
+        rows = rows[((rows >= 0) & (rows < 1)).all(axis=1)]
+        out[filled:filled + len(rows)] = rows
+        filled += len(rows)
+
+    return out
+
+
+def generate_data(dimentions, distribution, count, dtype=numpy.float64,\
+                  random_state=numpy.random):
+    check_parameters(dimentions, distribution, count)
+    return fill_rows(numpy.empty((count, dimentions), dtype), distribution,\
+        random_state)
+
+
+def generate_blocks(dimentions, distribution, count,\
+                    random_state=numpy.random):
+    check_parameters(dimentions, distribution, count)
+    generated = 0
+
+    while generated < count:
+        rows = min(BLOCK_ROWS, count - generated)
+        yield fill_rows(numpy.empty((rows, dimentions)), distribution,\
+            random_state)
+        generated += rows
+
+
+def write_data(file_name, dimentions, distribution, count, header=False,\
+               random_state=numpy.random):
+    with open(file_name, 'w') as out_file:
+        if header:
+            out_file.write('{0} {1}\n'.format(count, dimentions))
+        for block in generate_blocks(dimentions, distribution, count,\
+                                     random_state):
+            numpy.savetxt(out_file, block,\
+                fmt='%8.{0}f'.format(VALUE_DECIMALS))
+
+
+def read_data(file_name):
+    # Loads a file written by write_data (with header) into one contiguous
+    # array, whole chunks of lines are parsed at once
+    with open(file_name) as in_file:
+        count, dimentions = [int(x) for x in in_file.readline().split()]
+        data = numpy.empty(count * dimentions)
+        filled = 0
+        rest = ''
+
+        while True:
+            chunk = in_file.read(READ_CHUNK_BYTES)
+            at_end = not chunk
+            chunk = rest + chunk
+            if at_end:
+                rest = ''
+            else:
+                last_line = chunk.rfind('\n') + 1
+                chunk, rest = chunk[:last_line], chunk[last_line:]
+            values = numpy.fromstring(chunk, sep=' ')
+            if filled + len(values) > len(data):
+                raise Exception('Error: too many values in ' + file_name)
+            data[filled:filled + len(values)] = values
+            filled += len(values)
+            if at_end:
+                break
+
+    if filled != len(data):
+        raise Exception('Error: missing values in ' + file_name)
+    return data.reshape(count, dimentions)
+
+
+def stream_rows(counts, dimentions, distribution, random_state=numpy.random):
+    # Values of a block of streams, one after the other: the first counts[i]
+    # values of a kossmann row of the given dimentions for every stream.
+    # Equally distributed values are independent, so only those are drawn.
+    counts = numpy.asarray(counts, numpy.int64)
+    counts = counts[counts > 0]
+    if not len(counts):
+        return numpy.empty(0)
+    if counts.max() > dimentions:
+        raise Exception('Error: kossmann rows are narrower than the arrivals')
+    if distribution.upper() == 'E':
+        check_parameters(dimentions, distribution, len(counts))
+        return random_equal(0.0, 1.0, int(counts.sum()), random_state)
+    rows = generate_data(dimentions, distribution, len(counts),\
+        random_state=random_state)
+    return rows[numpy.arange(dimentions) < counts[:, None]]
+
+
+def write_stream_pool(file_name, sections, dimentions, distribution,\
+                      dtype=numpy.float64, random_states=None):
+    # Flat pool with exactly the values the counts of every section need,
+    # one section after the other. Each section is drawn from its own random
+    # state (if given).
+    sections = [numpy.asarray(counts, numpy.int64) for counts in sections]
+    if random_states is None:
+        random_states = [numpy.random] * len(sections)
+    total = sum(int(counts.sum()) for counts in sections)
+    pool = open_memmap(file_name, mode='w+', dtype=dtype, shape=(total,))
+    block_streams = max(1, POOL_BLOCK_VALUES / dimentions)
+    start = 0
+
+    for counts, random_state in zip(sections, random_states):
+        for first in range(0, len(counts), block_streams):
+            block = counts[first:first + block_streams]
+            end = start + int(block.sum())
+            pool[start:end] = numpy.around(stream_rows(block, dimentions,\
+                distribution, random_state), VALUE_DECIMALS)
+            start = end
+
+    pool.flush()
+    del pool
@@ -1,114 +1,259 @@
-import math, os, ast, sys, mmap, resource
+import os, sys, mmap, multiprocessing, numpy
+from kosmann_generator import VALUE_DECIMALS
+
+NPY_MAGIC = '\x93NUMPY'
+
+# Bytes that separate the values of text pools
+BLANK_BYTES = numpy.zeros(256, bool)
+BLANK_BYTES[[ord(char) for char in ' \t\r\n']] = True
+
+
+def line_lengths(text, rows):
+    # Values in every line, counted as the starts of their tokens
+    data = numpy.frombuffer(text, numpy.uint8)
+    blank = BLANK_BYTES[data]
+    starts = ~blank
+    starts[1:] &= blank[:-1]
+    lines = numpy.searchsorted(numpy.flatnonzero(data == ord('\n')),\
+        numpy.flatnonzero(starts))
+    return numpy.bincount(lines, minlength=rows)
+
+
+def parse_text_rows(text, rows):
+    # Whole blocks of lines are tokenized at once into a rows x values array,
+    # every line must have as many values as the first one
+    if not rows:
+        return numpy.empty((0, 0))
+    values = numpy.fromstring(text, sep=' ')
+    lengths = line_lengths(text, rows)
+    if len(lengths) != rows or (lengths != lengths[0]).any():
+        raise Exception('Error: kossmann file rows have different lengths')
+    # fromstring stops without an error at the first token it cannot parse
+    if len(values) != rows * lengths[0]:
+        raise Exception('Error: kossmann file has values that are not numbers')
+    return values.reshape(rows, lengths[0])
+
+
+def widened_values(values):
+    # Narrower pool types are widened back to the values written
+    if values.dtype != numpy.float64:
+        values = numpy.around(values.astype(numpy.float64), VALUE_DECIMALS)
+    return values
+
+
+def read_text_chunk(file_name, start, end, rows):
+    # Parses the rows of a text pool between two line offsets, so disjoint
+    # chunks of the same file can be read by several processes at once
+    with open(file_name, 'rb') as f:
+        text_pool = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+        try:
+            return parse_text_rows(text_pool[start:end], rows)
+        finally:
+            text_pool.close()
+
+
+def read_text_chunk_args(args):
+    return read_text_chunk(*args)
+
 
 class KosmannSplitter():
 
-    def __init__(self,kosmann_file_name, max_file_size_gb, verbose = False):
-        self.kosmann_file_name = kosmann_file_name
-        self.get_split_variables(max_file_size_gb)
+    # Pools written by the builder are flat, a row for every value. Pools of
+    # other tools have a row for every stream, of which only the first
+    # values are used.
 
-        if self.split_info['slicing']:
-            self.intermediate_file_names = \
-                                    ['x'+ self.split_format_num(\
-                                    self.split_info['slices'], i)\
-                                    for i in range(0,self.split_info['slices'])]
+    def __init__(self,kosmann_file_name, max_chunk_gb, verbose = False,\
+                 processes = 1):
+        self.kosmann_file_name = kosmann_file_name
+        self.binary = self.is_binary_pool(kosmann_file_name)
+        self.max_chunk_bytes = max(1, int(max_chunk_gb * (1024**3)))
+        # Rows before first_row belong to another reader, seek skips them
+        self.first_row = 0
+        self.cursor = 0
+        # Rows are read in the order of the permutation (if any), so the pool
+        # is shuffled without rewriting it
+        self.permutation = None
+        self.text_pool = None
+        self.line_offsets = None
+        # Reads of more than a chunk are parsed by a pool of processes,
+        # started with the first of them
+        self.processes = processes
+        self.parsers = None
 
+        if self.binary:
+            # Binary pools are never sliced, pages are read on demand
+            self.pool = numpy.load(kosmann_file_name, mmap_mode='r')
+        else:
+            # Text pools are read in place through an index of their lines
             if verbose:
-                sys.stdout.write('Splitting Kosmann file into chunks... ')
+                sys.stdout.write('Indexing Kosmann file lines... ')
                 sys.stdout.flush()
-
-            os.system('split -d -a {0} -n l/{1} {2}'.\
-                      format(self.split_info['suffix_length'],\
-                             self.split_info['slices'],\
-                             self.kosmann_file_name))
+            self.index_lines()
             if verbose:
                 sys.stdout.write('done.\n')
                 sys.stdout.flush()
 
-    def cleanup(self):
-        if self.split_info['slicing']:
-            for file_name in self.intermediate_file_names:
-                os.system('rm {0}'.format(file_name))
-
-    def get_split_variables(self,max_file_size_gb):
-        kosmann_file_size_bytes = os.stat(self.kosmann_file_name).st_size
-        kosmann_max_size_bytes = int(max_file_size_gb * \
-                                         (1024**3))
-
-        if kosmann_file_size_bytes > kosmann_max_size_bytes:
-            slices = int(math.floor( kosmann_file_size_bytes / \
-                                         kosmann_max_size_bytes))
-            if slices > 999:
-                raise NotImplementedError('File size is too big for slicing'+\
-                                              ' with current implementation.')
-
-            suffix_length = int(math.floor(math.log(slices,10))) + 1
-
-            self.split_info = {
-                'slicing' : True,
-                'suffix_length': suffix_length,
-                'slices' : slices
-            }
-        else:
-            self.split_info = {
-                'slicing' : False,
-            }
+        self.flat = self.columns() == 1
 
     @staticmethod
-    def check_linecache_memory():
-        G_MAX_MEM = 4
-        max_mem_kb = G_MAX_MEM * 1024 * 1024
-        mem_used = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-        perc_mem_used = math.ceil((mem_used * 100.0) / max_mem_kb)
+    def is_binary_pool(file_name):
+        with open(file_name,'rb') as f:
+            return f.read(len(NPY_MAGIC)) == NPY_MAGIC
 
-        if perc_mem_used >= 99:
-            linecache.clearcache()
-            print_verbose_message('\n[warning] linecache cleared\n')
+    def index_lines(self):
+        # Offset of the start of every line (and of the end of the last one)
+        with open(self.kosmann_file_name, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                self.text_pool = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+        if self.text_pool is None:
+            self.line_offsets = numpy.zeros(1, numpy.int64)
+            return
+        # The map is scanned in windows of max_chunk_bytes, so only the
+        # offsets take memory in proportion to the file
+        size = len(self.text_pool)
+        line_ends = [numpy.zeros(1, numpy.int64)]
+        for start in xrange(0, size, self.max_chunk_bytes):
+            data = numpy.frombuffer(self.text_pool, numpy.uint8,\
+                min(self.max_chunk_bytes, size - start), start)
+            line_ends.append(numpy.flatnonzero(data == ord('\n')) + start + 1)
+            del data
+        if self.text_pool[size - 1] != '\n':
+            line_ends.append(numpy.array([size]))
+        self.line_offsets = numpy.concatenate(line_ends)
 
-    @staticmethod
-    def intermediate_file_reader(file_name):
-        with open(file_name,'rb') as f:
-            m = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ) #File is open read-only
-            while m.tell() != m.size():
-                yield m.readline()
+    def columns(self):
+        if self.binary:
+            return self.pool.shape[1] if self.pool.ndim > 1 else 1
+        if not self.row_count():
+            return 1
+        return self.text_rows(0, 1).shape[1]
 
-        # i = 0
-        # while True:
-        #     # Rows are slided two positions, the first one beacuse
-        #     # the first line of the file is not used.
-        #     # The second because linecache cannot read line 0
+    def row_count(self):
+        if self.binary:
+            return self.pool.shape[0]
+        else:
+            return len(self.line_offsets) - 1
 
-        #     line = linecache.getline(file_name, i + 2)
-        #     if line == '':
-        #         break
-        #         # raise Exception('Error: Problem with linecache with line {0}'\
-        #         #                     .format(i))
-        #     yield line
-        #     i += 1
-        #     # self.check_linecache_memory()
+    def cleanup(self):
+        if self.binary:
+            del self.pool
+        if self.text_pool is not None:
+            self.text_pool.close()
+            self.text_pool = None
+        if self.parsers is not None:
+            self.parsers.terminate()
+            self.parsers = None
 
-        # linecache.clearcache()
+    def text_chunks(self, first_row=0, last_row=None):
+        # Byte ranges of whole lines of at most max_chunk_bytes (or a single
+        # longer line) covering the rows, as (start, end, rows) tuples
+        if last_row is None:
+            last_row = self.row_count()
+        offsets = self.line_offsets[first_row:last_row + 1]
+        if len(offsets) < 2:
+            return []
+        rows = [0]
+        while rows[-1] < len(offsets) - 1:
+            end = numpy.searchsorted(offsets,\
+                offsets[rows[-1]] + self.max_chunk_bytes, side='right') - 1
+            rows.append(max(end, rows[-1] + 1))
+        return [(int(offsets[start]), int(offsets[end]), end - start)\
+                for start, end in zip(rows[:-1], rows[1:])]
 
+    def read_text_rows(self, first_row=0, last_row=None):
+        # No more than max_chunk_bytes of text are parsed at once by each
+        # process
+        chunks = self.text_chunks(first_row, last_row)
+        if not chunks:
+            return numpy.empty((0, 0))
+        if len(chunks) == 1 or self.processes == 1:
+            parts = [parse_text_rows(self.text_pool[start:end], rows)\
+                     for start, end, rows in chunks]
+        else:
+            if self.parsers is None:
+                self.parsers = multiprocessing.Pool(self.processes)
+            parts = self.parsers.map(read_text_chunk_args,\
+                [(self.kosmann_file_name,) + chunk for chunk in chunks])
+        return numpy.concatenate(parts)
 
-        # inter_file = open(file_name)
+    def text_rows(self, first_row, last_row):
+        last_row = min(last_row, self.row_count())
+        if first_row >= last_row:
+            return numpy.empty((0, 0))
+        return self.read_text_rows(first_row, last_row)
 
-        # for line in inter_file:
-        #     yield line
-        # inter_file.close()
+    def shuffle(self, random_state):
+        self.permutation = random_state.permutation(self.row_count())
 
-    def split_format_num(self, slices, num):
-        return ("%0" + str(int(math.floor(math.log(slices,10))) + 1) + "i")%num
+    def rows_at(self, indexes):
+        # Rows are gathered in file order to keep the reads sequential
+        order = numpy.argsort(indexes)
+        if self.binary:
+            rows = numpy.empty((len(indexes),) + self.pool.shape[1:],\
+                               self.pool.dtype)
+            rows[order] = self.pool[indexes[order]]
+            return rows
 
-    def values_generator(self):
-        if self.split_info['slicing']:
+        starts = self.line_offsets[indexes[order]].tolist()
+        ends = self.line_offsets[indexes[order] + 1].tolist()
+        text = '\n'.join([self.text_pool[start:end].rstrip('\r\n')\
+                          for start, end in zip(starts, ends)])
+        values = parse_text_rows(text, len(indexes))
+        rows = numpy.empty(values.shape)
+        rows[order] = values
+        return rows
 
-            for file_name in self.intermediate_file_names:
-                file_reader = self.intermediate_file_reader(file_name)
+    def seek(self, row):
+        self.cursor = self.first_row + row
 
-                for line in file_reader:
-                    yield line.split()
+    def set_first_row(self, row):
+        self.first_row = row
+        self.cursor = row
 
+    def next_rows(self, count):
+        if self.permutation is not None:
+            rows = self.rows_at(\
+                self.permutation[self.cursor:self.cursor + count])
+        elif self.binary:
+            rows = self.pool[self.cursor:self.cursor + count]
         else:
-            file_reader = self.intermediate_file_reader(self.kosmann_file_name)
+            rows = self.text_rows(self.cursor, self.cursor + count)
 
-            for line in file_reader:
-                yield line.split()
+        if len(rows) < count:
+            raise Exception('Error: kossmann file has not enough rows')
+        self.cursor += count
+        return rows
+
+    def next_values(self, counts):
+        # The values of the next streams, one after the other
+        counts = numpy.asarray(counts, numpy.int64)
+        if self.flat:
+            values = self.next_rows(int(counts.sum())).reshape(counts.sum())
+        else:
+            rows = self.next_rows(len(counts))
+            if len(counts) and counts.max() > rows.shape[1]:
+                raise Exception('Error: kossmann file rows are narrower '+\
+                    'than the arrivals')
+            values = rows[numpy.arange(rows.shape[1]) < counts[:, None]]
+        return widened_values(values)
+
+    def stream_values(self, starts, streams, offsets):
+        # Value offsets[i] of every stream given, where the values of the
+        # streams of a flat pool start at starts
+        if self.flat:
+            rows = self.first_row + starts[streams] + offsets
+        else:
+            rows = self.first_row + streams
+        if self.permutation is not None:
+            rows = self.permutation[rows]
+        if len(rows) and rows.max() >= self.row_count():
+            raise Exception('Error: kossmann file has not enough rows')
+        rows = self.rows_at(rows)
+        if self.flat:
+            values = rows.reshape(len(streams))
+        else:
+            if len(offsets) and offsets.max() >= rows.shape[1]:
+                raise Exception('Error: kossmann file rows are narrower '+\
+                    'than the arrivals')
+            values = rows[numpy.arange(len(streams)), offsets]
+        return widened_values(values)
@@ -0,0 +1,160 @@
+import os, time, json, resource, cProfile, collections, contextlib
+
+# Bytes read and written by the process, through read and write calls
+PROC_IO_FILE = '/proc/self/io'
+# ru_inblock and ru_oublock are counted in blocks of this many bytes
+RUSAGE_BLOCK_BYTES = 512
+
+
+def io_counters():
+    if os.path.isfile(PROC_IO_FILE):
+        counters = {}
+        with open(PROC_IO_FILE) as io_file:
+            for line in io_file:
+                name, value = line.split(':')
+                counters[name] = int(value)
+        return (counters['rchar'], counters['wchar'])
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return (usage.ru_inblock * RUSAGE_BLOCK_BYTES,\
+            usage.ru_oublock * RUSAGE_BLOCK_BYTES)
+
+
+def peak_rss():
+    # In KB on Linux, the largest of the process and its waited children
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,\
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def sample():
+    times = os.times()
+    bytes_read, bytes_written = io_counters()
+    # CPU time of the children is added once they are waited for
+    return (time.time(), times[0] + times[1] + times[2] + times[3],\
+            bytes_read, bytes_written)
+
+
+class Telemetry():
+
+    # Stages may be nested (a stage pulling blocks from another one) and the
+    # time, CPU and IO are always charged to the innermost stage running, so
+    # the stages of a streamed pipeline are measured apart. With profile
+    # each stage has its own cProfile profiler, enabled while it runs.
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.stages = collections.OrderedDict()
+        self.profiles = {}
+        self.stack = []
+        self.start = sample()
+        self.last = self.start
+
+    def stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = collections.Counter({
+                'wall_time' : 0.0,
+                'cpu_time' : 0.0,
+                'events_in' : 0,
+                'events_out' : 0,
+                'bytes_read' : 0,
+                'bytes_written' : 0,
+                'peak_rss' : 0
+            })
+            if self.profile:
+                self.profiles[name] = cProfile.Profile()
+        return self.stages[name]
+
+    def switch(self):
+        # Charges everything since the last switch to the running stage
+        now = sample()
+        if self.stack:
+            stage = self.stages[self.stack[-1]]
+            stage['wall_time'] += now[0] - self.last[0]
+            stage['cpu_time'] += now[1] - self.last[1]
+            stage['bytes_read'] += now[2] - self.last[2]
+            stage['bytes_written'] += now[3] - self.last[3]
+            stage['peak_rss'] = max(stage['peak_rss'], peak_rss())
+        self.last = now
+
+    def enter(self, name):
+        self.stage(name)
+        self.switch()
+        if self.profile:
+            if self.stack:
+                self.profiles[self.stack[-1]].disable()
+            self.profiles[name].enable()
+        self.stack.append(name)
+
+    def exit(self):
+        self.switch()
+        name = self.stack.pop()
+        if self.profile:
+            self.profiles[name].disable()
+            if self.stack:
+                self.profiles[self.stack[-1]].enable()
+
+    def detach(self):
+        # For forked processes, that must not profile the stage of their
+        # parent
+        if self.profile and self.stack:
+            self.profiles[self.stack[-1]].disable()
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        self.enter(name)
+        try:
+            yield self.stages[name]
+        finally:
+            self.exit()
+
+    def blocks(self, name, blocks, into=None):
+        # Measures the stage that produces the blocks, the time between the
+        # blocks belongs to whoever consumes them (the stage into, if given,
+        # counts them as its input)
+        blocks = iter(blocks)
+        stage = self.stage(name)
+        if into is not None:
+            consumer = self.stage(into)
+        while True:
+            self.enter(name)
+            try:
+                block = next(blocks)
+            except StopIteration:
+                return
+            finally:
+                self.exit()
+            stage['events_out'] += len(block)
+            if into is not None:
+                consumer['events_in'] += len(block)
+            yield block
+
+    def report(self):
+        self.switch()
+        total = {
+            'wall_time' : self.last[0] - self.start[0],
+            'cpu_time' : self.last[1] - self.start[1],
+            'bytes_read' : self.last[2] - self.start[2],
+            'bytes_written' : self.last[3] - self.start[3],
+            'peak_rss' : peak_rss()
+        }
+        stages = []
+        for name, stage in self.stages.items():
+            stage = dict(stage)
+            stage['name'] = name
+            if stage['wall_time'] > 0:
+                stage['events_per_second'] = max(stage['events_in'],\
+                    stage['events_out']) / stage['wall_time']
+            else:
+                stage['events_per_second'] = 0.0
+            stages.append(stage)
+        return {'total' : total, 'stages' : stages}
+
+    def write_report(self, file_name, run_info):
+        report = dict(run_info)
+        report.update(self.report())
+        with open(file_name, 'w') as report_file:
+            json.dump(report, report_file, indent=1)
+
+    def dump_profiles(self, file_name_prefix):
+        for name in self.profiles:
+            self.profiles[name].dump_stats('{0}_{1}.prof'.format(\
+                file_name_prefix, name))
@@ -0,0 +1,38 @@
+#!/usr/bin/python2
+
+import unittest, sys, shutil, tempfile
+from os.path import dirname, abspath
+sys.path.append(dirname(dirname(abspath(__file__))))
+import benchmark
+
+class TestBenchmark(unittest.TestCase):
+  case = {'size' : 2000, 'dimentions' : 3, 'distribution' : 'C',\
+          'events_per_line' : 10}
+
+  def test_run_case(self):
+    '''it should measure every stage of the pipeline'''
+    output_dir = tempfile.mkdtemp()
+    try:
+      results = benchmark.run_case(self.case, output_dir)
+    finally:
+      shutil.rmtree(output_dir)
+    self.assertEqual([result['stage'] for result in results], benchmark.STAGES)
+    for result in results:
+      self.assertTrue(result['events'] > 0)
+      self.assertTrue(result['peak_rss'] > 0)
+      self.assertEqual(result['size'], 2000)
+
+  def test_compare_results(self):
+    '''it should report the stages slower than the baseline'''
+    def result(stage, wall_time):
+      return dict(self.case, stage=stage, wall_time=wall_time)
+    baseline = [result('sort', 1.0), result('join', 1.0), result('write', 0.01)]
+    results = [result('sort', 1.2), result('join', 1.3), result('write', 0.04),\
+               result('pool', 9.0)]
+    regressions = benchmark.compare_results(results, baseline, 25)
+    self.assertEqual([(r['stage'], b['wall_time']) for r, b in regressions],\
+      [('join', 1.0)])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,229 @@
+#!/usr/bin/python2
+
+import unittest, os, sys, glob, json, time, random, multiprocessing, numpy
+from os.path import dirname, abspath
+sys.path.append(dirname(dirname(abspath(__file__))))
+import builder
+from event_writer import format_events
+
+class TestStreamEvents(unittest.TestCase):
+  @staticmethod
+  def stream(parameters, joined=True):
+    return list(builder.stream_events(['-s', '2000', '-d', '3',\
+      '--poissparameter', '3', '--time', '100', '--interval', '100'] +\
+      parameters, joined=joined, batch_size=500))
+
+  def check_order(self, blocks):
+    events = numpy.concatenate(blocks)
+    keys = zip(events['ts'], events['type'], events['id'])
+    self.assertEqual(keys, sorted(keys))
+
+  def test_joined_events(self):
+    '''it should stream time ordered joined events in batches'''
+    blocks = self.stream([])
+    self.assertTrue(all(len(block) <= 500 for block in blocks))
+    self.assertEqual(blocks[0]['values'].shape[1], 6)
+    self.check_order(blocks)
+
+  def test_dynamic_events(self):
+    '''it should stream only the dynamic values when not joined'''
+    blocks = self.stream(['--sortfree'], joined=False)
+    self.assertEqual(blocks[0]['values'].shape[1], 3)
+    self.check_order(blocks)
+
+  def test_simulation_time(self):
+    '''it should not stream events after the simulation time'''
+    for parameters in [[], ['--sortfree']]:
+      events = numpy.concatenate(self.stream(parameters + ['--seed', '11']))
+      self.assertTrue((events['ts'] <= 100).all())
+
+  def test_seed(self):
+    '''it should generate the same events for the same seed'''
+    first = numpy.concatenate(self.stream(['--seed', '7']))
+    second = numpy.concatenate(self.stream(['--seed', '7']))
+    other = numpy.concatenate(self.stream(['--seed', '8']))
+    self.assertEqual(first.tostring(), second.tostring())
+    self.assertNotEqual(first.tostring(), other.tostring())
+
+  def test_value_precision(self):
+    '''it should print values with the decimals of the kossmann files'''
+    events = {}
+    for dtype in ['float64', 'float32']:
+      events[dtype] = numpy.concatenate(self.stream(['--seed', '7',\
+        '--pooldtype', dtype]))
+    self.assertEqual(events['float32'].tostring(),\
+      events['float64'].tostring())
+    for event in format_events(events['float32'][:1000]):
+      for value in event.strip('()').split(', ')[3:]:
+        self.assertTrue(len(value.split('.')[1]) <= 6, value)
+
+  def test_host_random_state(self):
+    '''it should leave the random module of the caller untouched'''
+    random.seed(3)
+    state = random.getstate()
+    self.stream(['--seed', '7'])
+    self.assertEqual(random.getstate(), state)
+
+  def test_interleaved_streams(self):
+    '''it should keep the options of every stream when they are interleaved'''
+    parameters = [['--seed', '7', '--time', '200', '--sortfree'],\
+      ['--seed', '8', '--sortfree']]
+    events_per_window = builder.EVENTS_PER_WINDOW
+    try:
+      # Calendar windows of a few blocks, so both streams are generated
+      # while they are interleaved
+      builder.EVENTS_PER_WINDOW = 2000
+      expected = [self.stream(stream_parameters)\
+                  for stream_parameters in parameters]
+      streams = [builder.stream_events(['-s', '2000', '-d', '3',\
+        '--poissparameter', '3', '--time', '100', '--interval', '100', '-o',\
+        'builder_tests.py'] + stream_parameters, batch_size=500)\
+        for stream_parameters in parameters]
+      blocks = [[], []]
+      for pair in map(None, *streams):
+        for i in range(0, 2):
+          if pair[i] is not None:
+            blocks[i].append(pair[i])
+    finally:
+      builder.EVENTS_PER_WINDOW = events_per_window
+    for i in range(0, 2):
+      self.assertEqual(numpy.concatenate(blocks[i]).tostring(),\
+        numpy.concatenate(expected[i]).tostring())
+    self.assertTrue((numpy.concatenate(blocks[0])['ts'] > 100).any())
+    self.assertEqual(glob.glob(dirname(abspath(builder.__file__)) +\
+      '/tmp_*'), [])
+
+  def test_memory_budget(self):
+    '''it should shard the join state when it does not fit in the budget'''
+    memory_budget_bytes = builder.memory_budget_bytes
+    shard_events = builder.shard_events
+    shards = []
+    def counted_shards(arrivals):
+      shards.append(builder.shard_count())
+      return shard_events(arrivals)
+    expected = numpy.concatenate(self.stream(['-s', '140000', '--seed', '7']))
+    try:
+      builder.memory_budget_bytes = lambda: 4 * 1024**2
+      builder.shard_events = counted_shards
+      events = numpy.concatenate(self.stream(['-s', '140000', '--seed', '7']))
+      self.assertTrue(shards[0] > 1)
+    finally:
+      builder.memory_budget_bytes = memory_budget_bytes
+      builder.shard_events = shard_events
+    self.assertEqual(events.tostring(), expected.tostring())
+
+  def test_text_chunk_budget(self):
+    '''it should parse text pools in chunks sized by the memory budget'''
+    numpy.savetxt('test_budget_pool', numpy.random.random_sample(1000))
+    try:
+      builder.parse_input(builder.get_options(['-s', '100', '-d', '3',\
+        '--memorybudget', '2']))
+      builder.G_RESUME = os.path.relpath(abspath('test_budget_pool'),\
+        dirname(abspath(builder.__file__)))
+      # Text chunks take 1/16 of the budget, split between the processes
+      self.assertEqual(builder.TEXT_CHUNK_MEMORY_SHARE, 1 / 16.0)
+      for processes in [1, 4]:
+        splitter = builder.pool_splitter(processes=processes)
+        self.assertEqual(splitter.max_chunk_bytes,\
+          2 * 1024**3 / 16 / processes)
+        splitter.cleanup()
+    finally:
+      os.remove('test_budget_pool')
+
+
+def run_task(seconds):
+  time.sleep(seconds)
+  if seconds == 0:
+    raise Exception('task failed')
+
+
+class TestProcesses(unittest.TestCase):
+  def test_failed_process(self):
+    '''it should stop the other processes when one of them fails'''
+    started = time.time()
+    self.assertRaises(Exception, builder.run_processes, run_task,\
+      [('Failing', (0,)), ('Slow', (30,)), ('Queued', (30,))], 2,\
+      {'Failing' : [], 'Slow' : [], 'Queued' : []})
+    self.assertTrue(time.time() - started < 30)
+    self.assertEqual(multiprocessing.active_children(), [])
+
+
+class TestCheckpoint(unittest.TestCase):
+  arguments = ['-s', '3000', '-d', '3', '--poissparameter', '3', '--time',\
+    '100', '--interval', '100']
+
+  def setUp(self):
+    self.write_outputfiles = builder.write_outputfiles
+    self.dataset_blocks = builder.dataset_blocks
+
+  def tearDown(self):
+    for name in glob.glob('test_checkpoint*') + glob.glob('test_resumed*'):
+      os.remove(name)
+    builder.write_outputfiles = self.write_outputfiles
+    builder.dataset_blocks = self.dataset_blocks
+
+  def test_resume(self):
+    '''it should continue an interrupted run from its sorted dataset'''
+    def interrupted(events, testcase_num):
+      next(events)
+      raise KeyboardInterrupt()
+    def not_generated(*args):
+      raise Exception('dataset generated again')
+
+    builder.write_outputfiles = interrupted
+    with self.assertRaises(KeyboardInterrupt):
+      builder.main(self.arguments + ['-o', 'test_checkpoint', '--checkpoint'])
+    builder.write_outputfiles = self.write_outputfiles
+    builder.dataset_blocks = not_generated
+    builder.main(self.arguments + ['-o', 'test_checkpoint', '--checkpoint'])
+    builder.dataset_blocks = self.dataset_blocks
+
+    seed = json.load(open('test_checkpoint_manifest'))['seed']
+    builder.main(self.arguments + ['-o', 'test_resumed', '--seed', str(seed)])
+    for name in ['_static', '_dyn', '_joined']:
+      self.assertEqual(open('test_checkpoint' + name).read(),\
+        open('test_resumed' + name).read())
+
+
+class TestLegacyPool(unittest.TestCase):
+  def tearDown(self):
+    for name in glob.glob('test_legacy*'):
+      os.remove(name)
+
+  def test_more_testcases(self):
+    '''it should resume a pool of rows with more testcases than it has rows for'''
+    numpy.savetxt('test_legacy_pool',\
+      numpy.random.random_sample((3 * 300 * 3, 40)), fmt='%8.6f')
+    builder.main(['-s', '300', '-d', '3', '--poissparameter', '3', '--time',\
+      '100', '--interval', '100', '--resume', os.path.relpath(\
+      abspath('test_legacy_pool'), dirname(abspath(builder.__file__))),\
+      '--testcases', '4', '-o', 'test_legacy'])
+    datasets = [open('test_legacy_{0}_dyn'.format(testcase)).read()\
+                for testcase in range(0, 4)]
+    self.assertTrue(all(datasets))
+    self.assertEqual(len(set(datasets)), 4)
+
+
+class TestTelemetry(unittest.TestCase):
+  def tearDown(self):
+    for name in glob.glob('test_telemetry*'):
+      os.remove(name)
+
+  def test_report(self):
+    '''it should report every stage of the run'''
+    builder.main(['-s', '3000', '-d', '3', '--poissparameter', '3',\
+      '--time', '100', '--interval', '100', '-o', 'test_telemetry',\
+      '--telemetry'])
+    report = json.load(open('test_telemetry_telemetry.json'))
+    self.assertTrue(report['completed'])
+    stages = dict((stage['name'], stage) for stage in report['stages'])
+    self.assertEqual(sorted(stages), sorted(['arrivals', 'static', 'pool',\
+      'events', 'sort', 'merge', 'join', 'write_dyn', 'write_joined']))
+    self.assertEqual(stages['events']['events_out'],\
+      stages['sort']['events_in'])
+    self.assertEqual(stages['join']['events_out'],\
+      stages['write_dyn']['events_in'])
+
+
+if __name__ == '__main__':
+  unittest.main()
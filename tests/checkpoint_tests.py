@@ -0,0 +1,49 @@
+#!/usr/bin/python2
+
+import unittest, os, sys
+from os.path import dirname, abspath
+sys.path.append(dirname(dirname(abspath(__file__))))
+from checkpoint import Checkpoint
+
+class TestCheckpoint(unittest.TestCase):
+  def tearDown(self):
+    for name in ['test_manifest', 'test_stage']:
+      if os.path.isfile(name):
+        os.remove(name)
+
+  def test_done(self):
+    '''it should keep completed stages for runs with the same parameters'''
+    with open('test_stage', 'w') as stage_file:
+      stage_file.write('stage data')
+    checkpoint = Checkpoint('test_manifest', [['-s', '10']])
+    checkpoint.seed = 7
+    self.assertFalse(checkpoint.done('stage'))
+    checkpoint.complete('stage', ['test_stage'], checksum=3)
+
+    resumed = Checkpoint('test_manifest', [['-s', '10']])
+    self.assertEqual(resumed.seed, 7)
+    self.assertTrue(resumed.done('stage'))
+    self.assertTrue(resumed.done('stage', 3))
+    self.assertFalse(resumed.done('stage', 4))
+    self.assertEqual(resumed.files('stage'), ['test_stage'])
+
+    other = Checkpoint('test_manifest', [['-s', '20']])
+    self.assertEqual(other.seed, None)
+    self.assertFalse(other.done('stage'))
+
+  def test_changed_files(self):
+    '''it should not take stages whose files changed as done'''
+    with open('test_stage', 'w') as stage_file:
+      stage_file.write('stage data')
+    checkpoint = Checkpoint('test_manifest', [])
+    checkpoint.complete('stage', ['test_stage'], intermediate=True)
+    with open('test_stage', 'w') as stage_file:
+      stage_file.write('Stage data')
+    self.assertFalse(checkpoint.done('stage'))
+    checkpoint.remove_intermediate()
+    self.assertFalse(os.path.isfile('test_stage'))
+    self.assertEqual(Checkpoint('test_manifest', []).stages, {})
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/python2
+
+import unittest, sys, numpy
+from os.path import dirname, abspath
+sys.path.append(dirname(dirname(abspath(__file__))))
+from event_sorter import EVENT_DTYPE
+from event_joiner import EventJoiner
+
+class TestEventJoiner(unittest.TestCase):
+  @staticmethod
+  def events(event_list):
+    return numpy.array(event_list, EVENT_DTYPE)
+
+  @staticmethod
+  def reference_join(events, size, dimentions, ttl, simulation_time):
+    pending = {}
+    arrived = {}
+    current_expiration = {}
+    updates = []
+    expirations = []
+    for ts_t, id_t, dim_t, val_t in events.tolist():
+      pending.setdefault(id_t, {})[dim_t] = val_t
+      arrived.setdefault(id_t, set()).add(dim_t)
+      if len(arrived[id_t]) < dimentions:
+        continue
+      arrived[id_t] = set()
+      old_exp = current_expiration.get(id_t)
+      if old_exp is not None and ts_t - old_exp >= ttl and\
+        old_exp < simulation_time:
+        expirations.append((old_exp, id_t))
+      current_expiration[id_t] = ts_t + ttl
+      updates.append((ts_t, id_t) + tuple(pending[id_t][d]\
+        for d in range(0, dimentions)))
+    return updates, expirations
+
+  def test_reference_join(self):
+    '''it should match an event by event join across blocks'''
+    count = 5000
+    events = numpy.empty(count, EVENT_DTYPE)
+    events['ts'] = numpy.sort(numpy.random.random_sample(count) * 100)
+    events['id'] = numpy.random.randint(0, 40, count)
+    events['dim'] = numpy.random.randint(0, 3, count)
+    events['value'] = numpy.random.random_sample(count)
+    joiner = EventJoiner(40, 3, 1.0, 90.0)
+    updates = []
+    expirations = []
+    for start in range(0, count, 333):
+      block_updates, block_expirations = joiner.join_block(\
+        events[start:start + 333])
+      ts, ids, values = block_updates
+      updates += [(t, i) + tuple(v) for t, i, v in\
+        zip(ts.tolist(), ids.tolist(), values.tolist())]
+      expirations += zip(*[x.tolist() for x in block_expirations])
+    reference = self.reference_join(events, 40, 3, 1.0, 90.0)
+    self.assertEqual(updates, reference[0])
+    self.assertEqual(sorted(expirations), sorted(reference[1]))
+
+  def test_update_events(self):
+    '''it should emit an update when every dimention of a tuple arrived'''
+    joiner = EventJoiner(2, 2, 10.0, 100.0)
+    updates, expirations = joiner.join_block(self.events([\
+      (1.0, 0, 0, 0.1), (2.0, 1, 0, 0.2), (3.0, 0, 0, 0.3),\
+      (4.0, 0, 1, 0.4), (5.0, 0, 1, 0.5)]))
+    ts, ids, values = updates
+    self.assertEqual(ts.tolist(), [4.0])
+    self.assertEqual(ids.tolist(), [0])
+    self.assertEqual(values.tolist(), [[0.3, 0.4]])
+    self.assertEqual(len(expirations[0]), 0)
+
+  def test_expirations(self):
+    '''it should expire tuples that are not updated within their ttl'''
+    joiner = EventJoiner(1, 2, 10.0, 100.0)
+    joiner.join_block(self.events([(1.0, 0, 0, 0.1), (2.0, 0, 1, 0.2)]))
+    updates, expirations = joiner.join_block(self.events([\
+      (40.0, 0, 0, 0.3), (41.0, 0, 1, 0.4)]))
+    self.assertEqual(expirations[0].tolist(), [12.0])
+    self.assertEqual(expirations[1].tolist(), [0])
+    ts, ids = joiner.final_expirations()
+    self.assertEqual(ts.tolist(), [51.0])
+
+  def test_ordered_events(self):
+    '''it should emit updates and expirations already in time order'''
+    count = 5000
+    events = numpy.empty(count, EVENT_DTYPE)
+    events['ts'] = numpy.sort(numpy.random.random_sample(count) * 100)
+    events['id'] = numpy.random.randint(0, 40, count)
+    events['dim'] = numpy.random.randint(0, 3, count)
+    events['value'] = numpy.random.random_sample(count)
+    joiner = EventJoiner(40, 3, 1.0, 90.0)
+    output = numpy.concatenate(list(joiner.ordered_events(\
+      [events[start:start + 333] for start in range(0, count, 333)])))
+    keys = zip(output['ts'].tolist(), output['type'].tolist(),\
+      output['id'].tolist())
+    self.assertEqual(keys, sorted(keys))
+
+    updates, expirations = self.reference_join(events, 40, 3, 1.0, 90.0)
+    reference = EventJoiner(40, 3, 1.0, 90.0)
+    reference.join_block(events)
+    expirations += zip(*[x.tolist() for x in reference.final_expirations()])
+    self.assertEqual(keys, sorted([(ts_t, 1, id_t) for ts_t, id_t in\
+      [update[:2] for update in updates]] +\
+      [(ts_t, 0, id_t) for ts_t, id_t in expirations]))
+
+
+if __name__ == '__main__':
+  unittest.main()
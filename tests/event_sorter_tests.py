@@ -0,0 +1,88 @@
+#!/usr/bin/python2
+
+import unittest, sys, numpy
+from os.path import dirname, abspath
+sys.path.append(dirname(dirname(abspath(__file__))))
+from event_sorter import EventSorter, EVENT_DTYPE, EVENT_KEYS,\
+                         merge_sorted_blocks, sort_order, fixed_size_blocks
+
+class TestEventSorter(unittest.TestCase):
+  @staticmethod
+  def random_events(count):
+    events = numpy.empty(count, EVENT_DTYPE)
+    events['ts'] = numpy.random.randint(0, 50, count) / 7.0
+    events['id'] = numpy.random.permutation(count)
+    events['dim'] = numpy.random.randint(0, 3, count)
+    events['value'] = numpy.random.random_sample(count)
+    return events
+
+  @staticmethod
+  def sorted_events(sorter):
+    blocks = list(sorter.sorted_blocks(block_size=100))
+    sorter.cleanup()
+    return numpy.concatenate(blocks)
+
+  def check_order(self, events):
+    keys = zip(events['ts'], events['id'], events['dim'])
+    self.assertEqual(keys, sorted(keys))
+
+  def test_in_memory(self):
+    '''it should sort events in memory when they fit in the budget'''
+    sorter = EventSorter(EVENT_DTYPE, EVENT_KEYS, 1024**3, 'test_sorter')
+    for i in range(0, 5):
+      sorter.add(self.random_events(200))
+    events = self.sorted_events(sorter)
+    self.assertTrue(sorter.in_memory)
+    self.assertEqual(len(events), 1000)
+    self.check_order(events)
+
+  def test_on_disk(self):
+    '''it should sort the same events on disk when the budget is exceeded'''
+    events = self.random_events(1000)
+    in_memory = EventSorter(EVENT_DTYPE, EVENT_KEYS, 1024**3, 'test_sorter')
+    on_disk = EventSorter(EVENT_DTYPE, EVENT_KEYS, 1000, 'test_sorter')
+    in_memory.add(events)
+    on_disk.add(events)
+    self.assertFalse(on_disk.in_memory)
+    disk_events = self.sorted_events(on_disk)
+    self.check_order(disk_events)
+    self.assertTrue((self.sorted_events(in_memory) == disk_events).all())
+
+  def test_resume(self):
+    '''it should read again the runs saved by another sorter'''
+    events = self.random_events(1000)
+    for budget in [1024**3, 1000]:
+      sorter = EventSorter(EVENT_DTYPE, EVENT_KEYS, budget, 'test_sorter')
+      sorter.add(events)
+      run_file_names = sorter.save_runs()
+      sorter.cleanup(remove_runs=False)
+      resumed = EventSorter(EVENT_DTYPE, EVENT_KEYS, budget, 'test_sorter')
+      resumed.resume(run_file_names)
+      resumed_events = self.sorted_events(resumed)
+      self.assertTrue((resumed_events ==\
+        events[sort_order(events, EVENT_KEYS)]).all())
+
+  def test_merge_sorted_blocks(self):
+    '''it should merge sorted streams of blocks into a single sorted stream'''
+    streams = []
+    events = self.random_events(3000)
+    for i in range(0, 3):
+      run = events[i * 1000:(i + 1) * 1000]
+      run = run[sort_order(run, EVENT_KEYS)]
+      streams.append([run[j:j + 64] for j in range(0, len(run), 64)])
+    merged = numpy.concatenate(list(merge_sorted_blocks(streams, EVENT_KEYS)))
+    self.assertEqual(len(merged), 3000)
+    self.check_order(merged)
+    self.assertTrue((merged == events[sort_order(events, EVENT_KEYS)]).all())
+
+  def test_fixed_size_blocks(self):
+    '''it should regroup a stream of blocks in blocks of the given size'''
+    events = self.random_events(1000)
+    blocks = list(fixed_size_blocks([events[:10], events[10:500],\
+      events[500:501], events[501:]], 300))
+    self.assertEqual([len(block) for block in blocks], [300, 300, 300, 100])
+    self.assertTrue((numpy.concatenate(blocks) == events).all())
+
+
+if __name__ == '__main__':
+  unittest.main()
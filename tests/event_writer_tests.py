@@ -0,0 +1,110 @@
+#!/usr/bin/python2
+
+import unittest, os, sys, gzip, zlib, multiprocessing, numpy
+from os.path import dirname, abspath
+sys.path.append(dirname(dirname(abspath(__file__))))
+from event_sorter import output_dtype, output_block
+import event_writer
+from event_writer import format_events
+from event_writer import TextEventWriter, BinaryEventWriter
+
+class TestEventWriter(unittest.TestCase):
+  def tearDown(self):
+    for name in ['test_writer', 'test_writer.index', 'test_writer_text']:
+      if os.path.isfile(name):
+        os.remove(name)
+
+  @staticmethod
+  def joined_events():
+    updates = output_block(output_dtype(4), [1.0, 3.0], 1, [7, 2],\
+      [[0.5, 0.25, 0.75, 0.125], [0.1, 0.2, 0.3, 0.4]])
+    expirations = output_block(output_dtype(4), [2.0], 0, [7])
+    return numpy.concatenate((updates[:1], expirations, updates[1:]))
+
+  def test_text_events(self):
+    '''it should write events as tuples, many per line'''
+    writer = TextEventWriter('test_writer', 2)
+    writer.write(self.joined_events())
+    writer.close()
+    self.assertEqual(open('test_writer').read(),\
+      '(1.0, 1, 7, 0.5, 0.25, 0.75, 0.125), (2.0, 0, 7)\n' +\
+      '(3.0, 1, 2, 0.1, 0.2, 0.3, 0.4)\n')
+
+  def test_text_lines(self):
+    '''it should keep lines of the same size across blocks and processes'''
+    events = numpy.concatenate([self.joined_events()] * 50)
+    expected = format_events(events)
+    expected = [', '.join(expected[i:i + 7]) for i in range(0, 150, 7)]
+    pool = multiprocessing.Pool(2)
+    for writer_pool in [None, pool]:
+      writer = TextEventWriter('test_writer', 7, writer_pool, 2)
+      for start in range(0, 150, 11):
+        writer.write(events[start:start + 11])
+      writer.write(events[:0])
+      writer.close()
+      self.assertEqual(open('test_writer').read().splitlines(), expected)
+    pool.terminate()
+
+  def test_compressed_text(self):
+    '''it should compress the text in blocks that can be read on their own'''
+    events = numpy.concatenate([self.joined_events()] * 50)
+    block_bytes = event_writer.COMPRESSION_BLOCK_BYTES
+    event_writer.COMPRESSION_BLOCK_BYTES = 1000
+    try:
+      writer = TextEventWriter('test_writer', 7, None, 2, 'gzip')
+      for start in range(0, 150, 11):
+        writer.write(events[start:start + 11])
+      writer.close()
+    finally:
+      event_writer.COMPRESSION_BLOCK_BYTES = block_bytes
+    writer = TextEventWriter('test_writer_text', 7)
+    writer.write(events)
+    writer.close()
+    text = open('test_writer_text').read()
+    self.assertEqual(gzip.open('test_writer').read(), text)
+
+    offsets = [[int(x) for x in line.split()]\
+      for line in open('test_writer.index')]
+    self.assertTrue(len(offsets) > 1)
+    uncompressed, compressed = offsets[-1]
+    member = open('test_writer', 'rb').read()[compressed:]
+    self.assertEqual(zlib.decompress(member, 16 + zlib.MAX_WBITS),\
+      text[uncompressed:])
+
+  def test_compressed_large_write(self):
+    '''it should split a large write in blocks of the compression size'''
+    text = ''.join(str(i) for i in range(0, 2000))
+    block_bytes = event_writer.COMPRESSION_BLOCK_BYTES
+    event_writer.COMPRESSION_BLOCK_BYTES = 1000
+    try:
+      compressed_file = event_writer.CompressedFile('test_writer', 'gzip', 2)
+      compressed_file.write(text[:10])
+      compressed_file.write(text[10:])
+      compressed_file.close()
+    finally:
+      event_writer.COMPRESSION_BLOCK_BYTES = block_bytes
+    self.assertEqual(gzip.open('test_writer').read(), text)
+    offsets = [int(line.split()[0]) for line in open('test_writer.index')]
+    self.assertEqual(offsets, range(0, len(text), 1000))
+
+  def test_binary_events(self):
+    '''it should write events as records that numpy can load'''
+    writer = BinaryEventWriter('test_writer', 2, 2, 10)
+    events = self.joined_events()
+    writer.write(events[:2])
+    writer.write(events[2:])
+    writer.close()
+    records = numpy.load('test_writer', mmap_mode='r')
+    self.assertEqual(len(records), 3)
+    self.assertEqual(records.dtype['id'], numpy.uint32)
+    self.assertEqual(records['ts'].tolist(), [1.0, 2.0, 3.0])
+    self.assertEqual(records['type'].tolist(), [1, 0, 1])
+    self.assertEqual(records['id'].tolist(), [7, 7, 2])
+    self.assertEqual(records['values'][2].tolist(), [0.1, 0.2])
+    self.assertEqual(records['static'][2].tolist(), [0.3, 0.4])
+    self.assertTrue(numpy.isnan(records['static'][1]).all())
+    del records
+
+
+if __name__ == '__main__':
+  unittest.main()
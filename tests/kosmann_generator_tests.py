@@ -0,0 +1,87 @@
+#!/usr/bin/python2
+
+import unittest, os, sys, numpy
+from os.path import dirname, abspath
+sys.path.append(dirname(dirname(abspath(__file__))))
+import kosmann_generator
+
+class TestKosmannGenerator(unittest.TestCase):
+  def test_unit_cube(self):
+    '''it should only generate values inside [0, 1) for every distribution'''
+    for distribution in ['E', 'C', 'A']:
+      data = kosmann_generator.generate_data(4, distribution, 20000)
+      self.assertEqual(data.shape, (20000, 4))
+      self.assertTrue((data >= 0).all() and (data < 1).all())
+
+  def test_correlation(self):
+    '''it should generate correlated and anticorrelated dimentions'''
+    correlated = kosmann_generator.generate_data(3, 'C', 20000)
+    anticorrelated = kosmann_generator.generate_data(3, 'A', 20000)
+    self.assertTrue(numpy.corrcoef(correlated.T)[0, 1] > 0.3)
+    self.assertTrue(numpy.corrcoef(anticorrelated.T)[0, 1] < -0.3)
+
+  def test_invalid_parameters(self):
+    '''it should reject the same parameters the original generator did'''
+    self.assertRaises(Exception, kosmann_generator.generate_data, 1, 'E', 10)
+    self.assertRaises(Exception, kosmann_generator.generate_data, 3, 'X', 10)
+    self.assertRaises(Exception, kosmann_generator.generate_data, 3, 'E', 0)
+
+  def test_stream_pool(self):
+    '''it should write exactly the values of every stream of every section'''
+    file_name = 'test_stream_pool.npy'
+    pool_block_values = kosmann_generator.POOL_BLOCK_VALUES
+    kosmann_generator.POOL_BLOCK_VALUES = 100
+    try:
+      counts = numpy.minimum(numpy.random.poisson(4, 5000), 6)
+      kosmann_generator.write_stream_pool(file_name, [counts, counts[:10]],\
+        6, 'C')
+      pool = numpy.load(file_name)
+      self.assertEqual(pool.shape, (counts.sum() + counts[:10].sum(),))
+      self.assertTrue((pool >= 0).all() and (pool < 1).all())
+      # The first two values of a stream are correlated dimentions
+      starts = (numpy.cumsum(counts) - counts)[counts >= 2]
+      self.assertTrue(numpy.corrcoef(pool[starts], pool[starts + 1])[0, 1]\
+        > 0.2)
+      self.assertRaises(Exception, kosmann_generator.write_stream_pool,\
+        file_name, [counts], 5, 'C')
+    finally:
+      kosmann_generator.POOL_BLOCK_VALUES = pool_block_values
+      os.remove(file_name)
+
+  def test_stream_rows(self):
+    '''it should keep the first values of rows as wide as the dimentions'''
+    counts = numpy.array([3, 0, 1, 6])
+    values = kosmann_generator.stream_rows(counts, 6, 'C',\
+      numpy.random.RandomState(5))
+    rows = kosmann_generator.generate_data(6, 'C', 3,\
+      random_state=numpy.random.RandomState(5))
+    self.assertEqual(values.tolist(), rows[0, :3].tolist() +\
+      rows[1, :1].tolist() + rows[2].tolist())
+
+  def test_equal_stream_rows(self):
+    '''it should draw only the values of the streams when equally distributed'''
+    counts = numpy.array([3, 0, 1, 6])
+    values = kosmann_generator.stream_rows(counts, 100, 'E',\
+      numpy.random.RandomState(5))
+    self.assertEqual(values.tolist(),\
+      numpy.random.RandomState(5).random_sample(10).tolist())
+
+  def test_read_data(self):
+    '''it should read back the values written in a text data file'''
+    file_name = 'test_read_data'
+    read_chunk_bytes = kosmann_generator.READ_CHUNK_BYTES
+    kosmann_generator.READ_CHUNK_BYTES = 1000
+    try:
+      kosmann_generator.write_data(file_name, 3, 'E', 5000, header=True)
+      data = kosmann_generator.read_data(file_name)
+      self.assertEqual(data.shape, (5000, 3))
+      lines = open(file_name).read().splitlines()[1:]
+      self.assertEqual(data.tolist(),\
+        [[float(x) for x in line.split()] for line in lines])
+    finally:
+      kosmann_generator.READ_CHUNK_BYTES = read_chunk_bytes
+      os.remove(file_name)
+
+
+if __name__ == '__main__':
+  unittest.main()
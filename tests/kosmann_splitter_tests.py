@@ -0,0 +1,161 @@
+#!/usr/bin/python2
+
+import unittest, os, sys, numpy
+from os.path import dirname, abspath
+sys.path.append(dirname(dirname(abspath(__file__))))
+import kosmann_generator
+from kosmann_splitter import KosmannSplitter
+
+class TestKosmannSplitter(unittest.TestCase):
+  def tearDown(self):
+    for name in ['test_text_pool', 'test_binary_pool']:
+      if os.path.isfile(name):
+        os.remove(name)
+
+  def test_binary_pool(self):
+    '''it should read binary pools as memory mapped rows'''
+    numpy.save('test_binary_pool', numpy.random.random_sample((100, 4)))
+    os.rename('test_binary_pool.npy', 'test_binary_pool')
+    splitter = KosmannSplitter('test_binary_pool', 5)
+    rows = splitter.next_rows(100)
+    self.assertTrue(splitter.binary)
+    self.assertFalse(splitter.flat)
+    self.assertTrue(isinstance(rows, numpy.memmap))
+    self.assertEqual(rows.shape, (100, 4))
+    splitter.cleanup()
+
+  def test_binary_pool_dtype(self):
+    '''it should keep the value type selected for the pool'''
+    kosmann_generator.write_stream_pool('test_binary_pool', [[3, 2]], 3,\
+      'C', 'float32')
+    splitter = KosmannSplitter('test_binary_pool', 5)
+    self.assertEqual(splitter.pool.dtype, numpy.float32)
+    splitter.cleanup()
+
+  def test_seek(self):
+    '''it should read pools from any row'''
+    kosmann_generator.write_data('test_text_pool', 4, 'E', 100)
+    rows = numpy.loadtxt('test_text_pool')
+    splitter = KosmannSplitter('test_text_pool', 5)
+    splitter.next_rows(10)
+    splitter.seek(60)
+    self.assertEqual(splitter.next_rows(10).tolist(), rows[60:70].tolist())
+    splitter.seek(5)
+    self.assertEqual(splitter.next_rows(10).tolist(), rows[5:15].tolist())
+    splitter.cleanup()
+
+  def test_shuffle(self):
+    '''it should read the rows of text and binary pools in a seeded order'''
+    rows = numpy.around(numpy.random.random_sample((100, 4)), 6)
+    numpy.savetxt('test_text_pool', rows, fmt='%8.6f')
+    numpy.save('test_binary_pool', rows)
+    os.rename('test_binary_pool.npy', 'test_binary_pool')
+    order = numpy.random.RandomState(3).permutation(100)
+    for name in ['test_text_pool', 'test_binary_pool']:
+      splitter = KosmannSplitter(name, 5)
+      splitter.shuffle(numpy.random.RandomState(3))
+      splitter.seek(10)
+      self.assertEqual(splitter.next_rows(90).tolist(),\
+        rows[order[10:]].tolist())
+      self.assertRaises(Exception, splitter.next_rows, 1)
+      splitter.cleanup()
+
+  def test_stream_values(self):
+    '''it should read single values of the streams of a pool'''
+    counts = numpy.array([3, 0, 1, 4])
+    streams, offsets = numpy.array([3, 0, 3, 2]), numpy.array([3, 2, 0, 0])
+    kosmann_generator.write_stream_pool('test_binary_pool', [[5], counts],\
+      5, 'C')
+    splitter = KosmannSplitter('test_binary_pool', 5)
+    splitter.set_first_row(5)
+    values = splitter.pool[5:]
+    self.assertEqual(splitter.stream_values(numpy.cumsum(counts) - counts,\
+      streams, offsets).tolist(), values[[7, 2, 4, 3]].tolist())
+    splitter.cleanup()
+    rows = numpy.around(numpy.random.random_sample((4, 5)), 6)
+    numpy.savetxt('test_text_pool', rows, fmt='%8.6f')
+    splitter = KosmannSplitter('test_text_pool', 5)
+    self.assertEqual(splitter.stream_values(None, streams, offsets).tolist(),\
+      rows[streams, offsets].tolist())
+    self.assertRaises(Exception, splitter.stream_values, None,\
+      numpy.array([4]), numpy.array([0]))
+    splitter.cleanup()
+
+  def test_first_row(self):
+    '''it should read the values of a flat pool from its first row'''
+    kosmann_generator.write_stream_pool('test_binary_pool', [[3, 0, 2, 5]],\
+      5, 'E')
+    splitter = KosmannSplitter('test_binary_pool', 5)
+    self.assertTrue(splitter.flat)
+    splitter.set_first_row(2)
+    values = splitter.next_values([1, 5])
+    self.assertEqual(values.tolist(), splitter.pool[2:8].tolist())
+    splitter.seek(1)
+    self.assertEqual(splitter.next_values([2]).tolist(), values[1:3].tolist())
+    self.assertRaises(Exception, splitter.next_values, [6])
+    splitter.cleanup()
+
+  def test_stream_rows(self):
+    '''it should take the first values of a row for every stream'''
+    kosmann_generator.write_data('test_text_pool', 4, 'E', 100)
+    rows = numpy.loadtxt('test_text_pool')
+    splitter = KosmannSplitter('test_text_pool', 5)
+    self.assertFalse(splitter.flat)
+    splitter.seek(10)
+    self.assertEqual(splitter.next_values([2, 0, 4]).tolist(),\
+      rows[10, :2].tolist() + rows[12].tolist())
+    self.assertRaises(Exception, splitter.next_values, [5])
+    splitter.cleanup()
+
+  def test_text_chunks(self):
+    '''it should read text pools in disjoint chunks of whole lines'''
+    kosmann_generator.write_data('test_text_pool', 4, 'E', 1000)
+    rows = numpy.loadtxt('test_text_pool')
+    splitter = KosmannSplitter('test_text_pool', 1000 / 1024.0**3,\
+      processes=2)
+    chunks = splitter.text_chunks()
+    self.assertTrue(len(chunks) > 20)
+    self.assertEqual(chunks[0][0], 0)
+    self.assertEqual(chunks[-1][1], os.path.getsize('test_text_pool'))
+    self.assertEqual(sum(chunk[2] for chunk in chunks), 1000)
+    self.assertTrue(all(end - start <= 1000 for start, end, count in chunks))
+    self.assertTrue(all(chunks[i][1] == chunks[i + 1][0]\
+      for i in range(0, len(chunks) - 1)))
+    self.assertEqual(splitter.read_text_rows().tolist(), rows.tolist())
+    splitter.seek(100)
+    self.assertEqual(splitter.next_rows(150).tolist(), rows[100:250].tolist())
+    self.assertTrue(splitter.parsers is not None)
+    splitter.cleanup()
+
+  def test_line_offsets(self):
+    '''it should index the lines of the pool in windows of a chunk'''
+    for text in ['0.1 0.2\n' * 300, '0.1 0.2\n' * 300 + '0.3 0.4']:
+      open('test_text_pool', 'w').write(text)
+      splitter = KosmannSplitter('test_text_pool', 100 / 1024.0**3)
+      self.assertEqual(splitter.line_offsets.tolist(), [0] +\
+        [i + 1 for i, char in enumerate(text) if char == '\n'] +\
+        ([len(text)] if text[-1] != '\n' else []))
+      self.assertEqual(splitter.row_count(), text.count('0.1') +\
+        text.count('0.3'))
+      splitter.cleanup()
+
+  def test_text_pool(self):
+    '''it should parse text pools into rows of floats'''
+    kosmann_generator.write_data('test_text_pool', 4, 'E', 100)
+    splitter = KosmannSplitter('test_text_pool', 5)
+    rows = splitter.next_rows(100)
+    self.assertFalse(splitter.binary)
+    self.assertEqual(rows.dtype, numpy.float64)
+    self.assertEqual(rows.tolist(), numpy.loadtxt('test_text_pool').tolist())
+    splitter.cleanup()
+
+  def test_invalid_text_pool(self):
+    '''it should reject ragged rows and values that are not numbers'''
+    for text in ['0.1 0.2 0.3\n0.1 0.2 0.3 0.4 0.5\n',\
+                 '0.1 0.2 abc 0.3\n0.1 0.2 0.3 0.4\n']:
+      open('test_text_pool', 'w').write(text)
+      self.assertRaises(Exception,\
+        lambda: KosmannSplitter('test_text_pool', 5).next_rows(2))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/python2
+
+import unittest, os, sys, time, json
+from os.path import dirname, abspath
+sys.path.append(dirname(dirname(abspath(__file__))))
+from telemetry import Telemetry
+
+class TestTelemetry(unittest.TestCase):
+  def tearDown(self):
+    for name in ['test_telemetry.json', 'test_telemetry_inner.prof',\
+                 'test_telemetry_outer.prof']:
+      if os.path.isfile(name):
+        os.remove(name)
+
+  @staticmethod
+  def slow_blocks():
+    for i in range(0, 3):
+      time.sleep(0.02)
+      yield range(0, 10)
+
+  def test_nested_stages(self):
+    '''it should charge the time of nested stages to the innermost one'''
+    telemetry = Telemetry()
+    with telemetry.measure('outer'):
+      for block in telemetry.blocks('inner', self.slow_blocks(), 'outer'):
+        time.sleep(0.01)
+    stages = dict((stage['name'], stage)\
+                  for stage in telemetry.report()['stages'])
+    self.assertTrue(0.06 <= stages['inner']['wall_time'] < 0.09)
+    self.assertTrue(0.03 <= stages['outer']['wall_time'] < 0.06)
+    self.assertEqual(stages['inner']['events_out'], 30)
+    self.assertEqual(stages['outer']['events_in'], 30)
+    self.assertTrue(stages['inner']['peak_rss'] > 0)
+
+  def test_report(self):
+    '''it should write the json report and a profile per stage'''
+    telemetry = Telemetry(profile=True)
+    with telemetry.measure('outer') as stage:
+      stage['events_out'] += 5
+      with telemetry.measure('inner'):
+        sorted(range(0, 1000))
+    telemetry.write_report('test_telemetry.json', {'seed' : 1})
+    telemetry.dump_profiles('test_telemetry')
+    report = json.load(open('test_telemetry.json'))
+    self.assertEqual(report['seed'], 1)
+    self.assertEqual([stage['name'] for stage in report['stages']],\
+      ['outer', 'inner'])
+    self.assertEqual(report['stages'][0]['events_out'], 5)
+    self.assertTrue(os.path.isfile('test_telemetry_inner.prof'))
+
+
+if __name__ == '__main__':
+  unittest.main()